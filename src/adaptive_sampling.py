@@ -0,0 +1,86 @@
+import bisect
+from typing import Any, Callable, Dict, List, Optional
+
+
+Item = Dict[str, Any]
+
+
+def coarse_step(times: List[Optional[float]], coarse_fps: float) -> int:
+    """
+    Paso (en índices) para muestrear ~coarse_fps, según el dt mediano entre frames.
+    Sin tiempos confiables retorna 1 (se analiza todo).
+    """
+    if coarse_fps <= 0 or len(times) < 2 or any(t is None for t in times):
+        return 1
+    dts = sorted(b - a for a, b in zip(times, times[1:]) if b > a)
+    if not dts:
+        return 1
+    dt = dts[len(dts) // 2]
+    return max(1, int(round(1.0 / (coarse_fps * dt))))
+
+
+def confidence(item: Item) -> float:
+    scores = item.get("scores") or {}
+    return max((float(v) for v in scores.values()), default=0.0)
+
+
+def needs_refine(a: Item, b: Item, min_confidence: float) -> bool:
+    """
+    Hay que mirar entre a y b si alguno falló, si difieren en la emoción dominante
+    o si alguno tiene el puntaje máximo bajo min_confidence (%).
+    """
+    if "error" in a or "error" in b:
+        return True
+    if a.get("dominant_emotion") != b.get("dominant_emotion"):
+        return True
+    return min(confidence(a), confidence(b)) < min_confidence
+
+
+def refine(
+    n: int,
+    step: int,
+    analyze: Callable[[List[int]], Dict[int, Item]],
+    should_split: Callable[[Item, Item], bool],
+) -> Dict[int, Item]:
+    """
+    Grueso a fino: analiza la grilla 0, step, 2*step, ... (y el último) y, por rondas,
+    el punto medio de cada intervalo donde should_split(a, b), hasta llegar a vecinos.
+    analyze recibe TODOS los índices de una ronda juntos (para lotes / pool).
+    """
+    if n <= 0:
+        return {}
+    grid = sorted(set(range(0, n, max(1, step))) | {n - 1})
+    done = dict(analyze(grid))
+    intervals = list(zip(grid, grid[1:]))
+    while True:
+        split = [(a, b) for a, b in intervals if b - a > 1 and should_split(done[a], done[b])]
+        if not split:
+            return done
+        mids = [(a + b) // 2 for a, b in split]
+        done.update(analyze(mids))
+        intervals = [iv for (a, b), m in zip(split, mids) for iv in ((a, m), (m, b))]
+
+
+def interpolate(i: int, times: List[Optional[float]], done: Dict[int, Item], keys: List[int]) -> Item:
+    """
+    Resultado para un índice no analizado: interpolación lineal (por tiempo) de los
+    puntajes de los vecinos analizados. keys: índices de done, ordenados.
+    """
+    k = bisect.bisect_left(keys, i)
+    a = done[keys[max(0, k - 1)]]
+    b = done[keys[min(len(keys) - 1, k)]]
+    ia, ib = keys[max(0, k - 1)], keys[min(len(keys) - 1, k)]
+    if "error" in a or "error" in b or ia == ib:
+        src = b if "error" in a else a
+        return {"dominant_emotion": src.get("dominant_emotion"), "scores": dict(src.get("scores") or {}),
+                "interpolated": True}
+
+    ta, tb, ti = times[ia], times[ib], times[i]
+    if None in (ta, tb, ti) or tb == ta:
+        w = (i - ia) / float(ib - ia)
+    else:
+        w = (ti - ta) / (tb - ta)
+    sa, sb = a.get("scores") or {}, b.get("scores") or {}
+    scores = {lab: (1.0 - w) * float(sa[lab]) + w * float(sb[lab]) for lab in sa if lab in sb}
+    dominant = max(scores, key=scores.get) if scores else a.get("dominant_emotion")
+    return {"dominant_emotion": dominant, "scores": scores, "interpolated": True}
@@ -0,0 +1,67 @@
+import os
+import time
+import argparse
+from pathlib import Path
+
+from extract_frames import MODES, _iter_sampled, open_video
+
+
+def bench_one(video_path: str, target_fps: float, mode: str) -> dict:
+    """
+    Recorre el video en el modo dado SIN escribir JPEGs (solo decodificación).
+    decoded_fps = frames de video avanzados por segundo de reloj.
+    """
+    cap, fps, step, resolved = open_video(video_path, target_fps=target_fps, mode=mode)
+
+    t0 = time.perf_counter()
+    kept = 0
+    last = 0
+    for i, _frame in _iter_sampled(cap, fps, step, resolved):
+        kept += 1
+        last = i
+    elapsed = time.perf_counter() - t0
+    cap.release()
+
+    advanced = last + 1 if kept else 0
+    return {
+        "mode": resolved,
+        "kept": kept,
+        "elapsed": elapsed,
+        "decoded_fps": advanced / elapsed if elapsed > 0 else 0.0,
+        "kept_fps": kept / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de decodificación de extract_frames (read vs grab vs seek)")
+    ap.add_argument("--videos-dir", default="data/raw_videos", help="Carpeta con videos .mp4")
+    ap.add_argument("--names", nargs="*", default=None, help="Nombres base a medir (sin .mp4). Si no, todos.")
+    ap.add_argument("--target-fps", type=float, default=2.0, help="Frames por segundo a conservar")
+    ap.add_argument("--modes", nargs="*", default=["read", "grab", "seek"], choices=MODES, help="Modos a comparar")
+    args = ap.parse_args()
+
+    if args.names:
+        videos = [os.path.join(args.videos_dir, f"{n}.mp4") for n in args.names]
+    else:
+        videos = sorted([str(p) for p in Path(args.videos_dir).glob("*.mp4")])
+
+    if not videos:
+        raise SystemExit(f"No se encontraron videos .mp4 en: {args.videos_dir}")
+
+    for vp in videos:
+        name = Path(vp).stem
+        base = None
+        for mode in args.modes:
+            r = bench_one(vp, args.target_fps, mode)
+            if base is None:
+                base = r["elapsed"]
+            speedup = base / r["elapsed"] if r["elapsed"] > 0 else 0.0
+            print(
+                f"⏱️ {name} | mode={mode}->{r['mode']} | kept={r['kept']} | "
+                f"decoded_fps={r['decoded_fps']:.1f} | kept_fps={r['kept_fps']:.1f} | "
+                f"t={r['elapsed']:.2f}s | x{speedup:.2f} vs {args.modes[0]}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import os
+import time
+import argparse
+from typing import Any, Dict
+
+import numpy as np
+
+from emotion_backend import DEFAULT_ONNX_PATH, EMOTION_LABELS, KerasEmotionBackend, OnnxEmotionBackend
+from export_emotion_onnx import face_inputs, int8_path_for
+from video_utils import write_json
+
+
+def _normalize(p: np.ndarray) -> np.ndarray:
+    # mismos puntajes que reporta el pipeline: % que suman 100 por fila
+    return 100.0 * p / np.maximum(p.sum(axis=1, keepdims=True), 1e-12)
+
+
+def _timed_predict(backend, batch: np.ndarray, batch_size: int):
+    out = []
+    t0 = time.perf_counter()
+    for k in range(0, len(batch), batch_size):
+        out.append(backend.predict(batch[k:k + batch_size]))
+    return np.concatenate(out), time.perf_counter() - t0
+
+
+def compare(ref: np.ndarray, other: np.ndarray) -> Dict[str, Any]:
+    """
+    Concordancia de la emoción dominante y desvío de puntajes (puntos porcentuales).
+    """
+    a, b = _normalize(ref), _normalize(other)
+    diff = np.abs(a - b)
+    return {
+        "agreement": float(np.mean(a.argmax(axis=1) == b.argmax(axis=1))),
+        "mean_abs_diff": float(diff.mean()),
+        "max_abs_diff": float(diff.max()),
+        "per_label_mean_abs_diff": {lab: float(diff[:, k].mean()) for k, lab in enumerate(EMOTION_LABELS)},
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Paridad ONNX vs DeepFace (Keras) sobre los mismos recortes de cara")
+    ap.add_argument("--frames-root", default="data/extracted_frames", help="Carpetas de frames por video")
+    ap.add_argument("--onnx", nargs="*", default=None,
+                    help=f"Modelos a comparar (default {DEFAULT_ONNX_PATH} y su versión _int8 si existe)")
+    ap.add_argument("--limit", type=int, default=0, help="Máximo de frames (repartidos entre videos). 0 = todos")
+    ap.add_argument("--batch-size", type=int, default=32)
+    ap.add_argument("--no-enhance", action="store_true", help="Desactiva CLAHE (igual que el pipeline)")
+    ap.add_argument("--out", default=None, help="JSON con el reporte (opcional)")
+    args = ap.parse_args()
+
+    paths = args.onnx
+    if paths is None:
+        paths = [p for p in (DEFAULT_ONNX_PATH, int8_path_for(DEFAULT_ONNX_PATH)) if os.path.isfile(p)]
+    if not paths:
+        raise SystemExit("No hay modelos ONNX para comparar (genéralos con src/export_emotion_onnx.py)")
+
+    inputs = face_inputs(args.frames_root, limit=args.limit, enhance=not args.no_enhance)
+    if not inputs:
+        raise SystemExit(f"No se obtuvieron recortes de cara en: {args.frames_root}")
+    batch = np.stack(inputs)[..., None].astype(np.float32)
+
+    ref, t_ref = _timed_predict(KerasEmotionBackend(), batch, args.batch_size)
+    n = len(batch)
+    print(f"⏱️ deepface (keras) | n={n} | t={t_ref:.2f}s | {n / t_ref if t_ref > 0 else 0.0:.1f} caras/s")
+
+    report = {"frames_root": args.frames_root, "n_faces": n, "deepface_seconds": t_ref, "backends": {}}
+    for path in paths:
+        pred, t = _timed_predict(OnnxEmotionBackend(path), batch, args.batch_size)
+        r = {**compare(ref, pred), "seconds": t, "speedup": t_ref / t if t > 0 else 0.0}
+        report["backends"][path] = r
+        print(
+            f"📊 {path} | acuerdo={100 * r['agreement']:.1f}% | "
+            f"desvío medio={r['mean_abs_diff']:.2f} pp | máx={r['max_abs_diff']:.2f} pp | "
+            f"t={t:.2f}s | x{r['speedup']:.2f} vs deepface"
+        )
+
+    if args.out:
+        write_json(report, args.out)
+        print(f"✅ Reporte: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import os
+import hashlib
+import threading
+from typing import Dict
+
+import numpy as np
+
+
+# orden de salida del modelo "Emotion" de DeepFace (el ONNX exportado conserva el mismo)
+EMOTION_LABELS = ("angry", "disgust", "fear", "happy", "sad", "surprise", "neutral")
+EMOTION_INPUT = 48
+
+DEEPFACE = "deepface"
+DEFAULT_ONNX_PATH = "models/face_emotion.onnx"
+
+
+def scores_from_probs(p) -> Dict[str, object]:
+    """
+    Salida del modelo (7 probabilidades) -> {dominant_emotion, scores en %} como DeepFace.analyze.
+    """
+    total = float(np.sum(p)) or 1.0
+    return {
+        "dominant_emotion": EMOTION_LABELS[int(np.argmax(p))],
+        "scores": {lab: 100.0 * float(v) / total for lab, v in zip(EMOTION_LABELS, p)}
+    }
+
+
+def load_deepface_emotion_model():
+    """
+    Modelo Keras de emociones de DeepFace (48x48x1 -> 7 probabilidades).
+    """
+    from deepface import DeepFace
+
+    try:
+        m = DeepFace.build_model(task="facial_attribute", model_name="Emotion")  # deepface >= 0.0.93
+    except TypeError:
+        m = DeepFace.build_model("Emotion")
+    return getattr(m, "model", m)  # wrapper de DeepFace (.model) o el Keras directo
+
+
+class KerasEmotionBackend:
+    name = DEEPFACE
+
+    def __init__(self):
+        self.model = load_deepface_emotion_model()
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return np.asarray(self.model.predict(batch, verbose=0))
+
+
+class OnnxEmotionBackend:
+    """
+    Mismo modelo exportado a ONNX (export_emotion_onnx.py), en CPU con ONNX Runtime;
+    sirve igual para la versión float32 y la int8. No importa TensorFlow.
+    """
+
+    def __init__(self, path: str, threads: int = 0):
+        import onnxruntime as ort
+
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"No existe el modelo ONNX: {path} (genéralo con src/export_emotion_onnx.py)")
+        so = ort.SessionOptions()
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            so.intra_op_num_threads = threads
+        self.name = path
+        self.session = ort.InferenceSession(path, sess_options=so, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: batch.astype(np.float32, copy=False)})[0]
+
+
+_fingerprints: Dict[tuple, str] = {}
+
+
+def backend_fingerprint(spec: str = DEEPFACE) -> str:
+    """
+    Identidad del modelo para claves de cache: "deepface" o sha256 del .onnx
+    (re-exportar / re-cuantizar al mismo nombre cambia la clave). Se recalcula
+    solo si cambian ruta, tamaño o mtime del archivo.
+    """
+    if spec == DEEPFACE:
+        return DEEPFACE
+    path = os.path.abspath(spec)
+    st = os.stat(path)
+    sig = (path, st.st_size, st.st_mtime_ns)
+    fp = _fingerprints.get(sig)
+    if fp is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        fp = _fingerprints[sig] = f"onnx:{h.hexdigest()}"
+    return fp
+
+
+_backends: Dict[str, object] = {}
+_lock = threading.Lock()
+
+
+def get_emotion_backend(spec: str = DEEPFACE, threads: int = 0):
+    """
+    spec: "deepface" (Keras/TF) o ruta a un .onnx. Se carga una vez por proceso
+    (threads: hilos de ONNX Runtime, solo cuenta en la primera carga; 0 = todos).
+    """
+    with _lock:
+        b = _backends.get(spec)
+        if b is None:
+            b = KerasEmotionBackend() if spec == DEEPFACE else OnnxEmotionBackend(spec, threads=threads)
+            _backends[spec] = b
+        return b
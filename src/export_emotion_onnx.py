@@ -0,0 +1,114 @@
+import os
+import argparse
+from pathlib import Path
+from typing import List
+
+import cv2
+import numpy as np
+
+from emotion_backend import DEFAULT_ONNX_PATH, EMOTION_INPUT, load_deepface_emotion_model
+
+
+def export_onnx(out_path: str = DEFAULT_ONNX_PATH, opset: int = 13) -> str:
+    """
+    Convierte el modelo Keras de emociones de DeepFace a ONNX (float32),
+    con batch dinámico: entrada (N, 48, 48, 1) -> salida (N, 7).
+    """
+    import tensorflow as tf
+    import tf2onnx
+
+    model = load_deepface_emotion_model()
+    spec = (tf.TensorSpec((None, EMOTION_INPUT, EMOTION_INPUT, 1), tf.float32, name="input"),)
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=opset, output_path=out_path)
+    return out_path
+
+
+def face_inputs(frames_root: str, limit: int = 0, enhance: bool = True) -> List[np.ndarray]:
+    """
+    Recortes 48x48 (como los ve el modelo) de los .jpg en frames_root/<video>/,
+    tomando frames repartidos entre todos los videos. Frames sin cara se saltan.
+    """
+    from face_emotion_day2 import _enhance_clahe_bgr, _face_crop_gray
+
+    folders = sorted(p for p in Path(frames_root).iterdir() if p.is_dir())
+    per_folder = [sorted(f.glob("*.jpg")) for f in folders]
+    if limit > 0 and folders:
+        k = max(1, limit // len(folders))
+        per_folder = [files[:: max(1, len(files) // k)][:k] for files in per_folder]
+
+    out = []
+    for files in per_folder:
+        for f in files:
+            img = cv2.imread(str(f))
+            if img is None:
+                continue
+            if enhance:
+                img = _enhance_clahe_bgr(img)
+            try:
+                out.append(_face_crop_gray(img, enforce_detection=True))
+            except Exception:
+                continue
+    return out
+
+
+def quantize_int8(fp32_path: str, out_path: str, calib: List[np.ndarray]) -> str:
+    """
+    int8 estático (QDQ, pesos por canal) calibrado con recortes reales;
+    sin recortes de calibración cae a cuantización dinámica (solo pesos).
+    """
+    from onnxruntime.quantization import (
+        CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, quantize_static
+    )
+
+    if not calib:
+        quantize_dynamic(fp32_path, out_path, weight_type=QuantType.QInt8)
+        return out_path
+
+    class _Reader(CalibrationDataReader):
+        def __init__(self, inputs: List[np.ndarray]):
+            self._it = iter(inputs)
+
+        def get_next(self):
+            x = next(self._it, None)
+            return None if x is None else {"input": x[None, :, :, None].astype(np.float32)}
+
+    quantize_static(
+        fp32_path,
+        out_path,
+        _Reader(calib),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+    return out_path
+
+
+def int8_path_for(fp32_path: str) -> str:
+    base, ext = os.path.splitext(fp32_path)
+    return f"{base}_int8{ext}"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Exporta el modelo de emociones de DeepFace a ONNX (opcional int8)")
+    ap.add_argument("--out", default=DEFAULT_ONNX_PATH, help="Ruta del .onnx float32")
+    ap.add_argument("--opset", type=int, default=13)
+    ap.add_argument("--int8", action="store_true", help="Genera además <out>_int8.onnx")
+    ap.add_argument("--calib-root", default="data/extracted_frames",
+                    help="Frames para calibrar la cuantización estática (carpetas por video)")
+    ap.add_argument("--calib-n", type=int, default=200, help="Recortes de calibración (0 = cuantización dinámica)")
+    args = ap.parse_args()
+
+    fp32 = export_onnx(args.out, opset=args.opset)
+    print(f"✅ ONNX: {fp32}")
+
+    if args.int8:
+        calib = face_inputs(args.calib_root, limit=args.calib_n) if args.calib_n > 0 else []
+        q = quantize_int8(fp32, int8_path_for(fp32), calib)
+        mode = f"estática, {len(calib)} recortes" if calib else "dinámica"
+        print(f"✅ ONNX int8 ({mode}): {q}")
+
+
+if __name__ == "__main__":
+    main()
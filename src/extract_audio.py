@@ -1,18 +1,79 @@
 import os
+import wave
 import argparse
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from moviepy import VideoFileClip
+from typing import Iterable, Iterator
 
+import numpy as np
+
+from video_utils import ffmpeg_exe, sort_longest_first
+
+
+SAMPLE_RATE = 16000
+BACKENDS = ("ffmpeg", "moviepy")
+
+
+def iter_pcm_chunks(video_path: str, chunk_seconds: float = 10.0, sr: int = SAMPLE_RATE) -> Iterator[np.ndarray]:
+    """
+    Decodifica el audio con ffmpeg por pipe y entrega chunks int16 mono a `sr` Hz
+    de chunk_seconds cada uno (el último puede ser más corto). Memoria acotada a un chunk.
+    """
+    cmd = [
+        ffmpeg_exe(), "-v", "error", "-nostdin", "-i", video_path,
+        "-map", "0:a:0", "-vn", "-ac", "1", "-ar", str(sr), "-f", "s16le", "pipe:1",
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    chunk_bytes = max(2, int(chunk_seconds * sr) * 2)
+    got_any = False
+    finished = False
+    try:
+        while True:
+            buf = proc.stdout.read(chunk_bytes)
+            if not buf:
+                break
+            got_any = True
+            yield np.frombuffer(buf[: len(buf) - (len(buf) % 2)], dtype=np.int16)
+        finished = True
+    finally:
+        proc.stdout.close()
+        if not finished:
+            proc.kill()
+        err = proc.stderr.read().decode("utf-8", errors="replace").strip()
+        proc.stderr.close()
+        code = proc.wait()
+    if code != 0 or not got_any:
+        if not got_any or "matches no streams" in err:
+            raise RuntimeError(f"El video no tiene audio: {video_path}")
+        raise RuntimeError(f"ffmpeg falló ({code}) en {video_path}: {err}")
+
+
+def tee_wav(chunks: Iterable[np.ndarray], audio_out: str, sr: int = SAMPLE_RATE) -> Iterator[np.ndarray]:
+    """
+    Pasa los chunks tal cual y a la vez los va escribiendo en un WAV pcm_s16le.
+    Útil para transcribir mientras se extrae sin perder el WAV.
+    """
+    os.makedirs(os.path.dirname(audio_out) or ".", exist_ok=True)
+    with wave.open(audio_out, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        for c in chunks:
+            w.writeframes(np.ascontiguousarray(c, dtype="<i2").tobytes())
+            yield c
+
+
+def _extract_audio_moviepy(video_path: str, audio_out: str) -> str:
+    from moviepy import VideoFileClip  # solo si se pide este backend (import pesado)
 
-def extract_audio(video_path: str, audio_out: str) -> str:
-    os.makedirs(os.path.dirname(audio_out), exist_ok=True)
     clip = VideoFileClip(video_path)
     if clip.audio is None:
         raise RuntimeError(f"El video no tiene audio: {video_path}")
 
     clip.audio.write_audiofile(
     audio_out,
-    fps=16000,
+    fps=SAMPLE_RATE,
     nbytes=2,
     codec="pcm_s16le"
     )
@@ -21,11 +82,32 @@ def extract_audio(video_path: str, audio_out: str) -> str:
     return audio_out
 
 
+def extract_audio(video_path: str, audio_out: str, backend: str = "ffmpeg") -> str:
+    """
+    backend:
+      - ffmpeg: streaming por pipe (16 kHz mono int16), escribe el WAV por chunks
+      - moviepy: VideoFileClip + write_audiofile (camino original)
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend desconocido: {backend} (usa {', '.join(BACKENDS)})")
+
+    os.makedirs(os.path.dirname(audio_out), exist_ok=True)
+    if backend == "moviepy":
+        return _extract_audio_moviepy(video_path, audio_out)
+
+    for _ in tee_wav(iter_pcm_chunks(video_path), audio_out):
+        pass
+    return audio_out
+
+
 def main():
     ap = argparse.ArgumentParser(description="Extraer audio WAV (16kHz) desde videos")
     ap.add_argument("--videos-dir", default="data/raw_videos", help="Carpeta con videos .mp4")
     ap.add_argument("--out-dir", default="outputs/audio", help="Carpeta salida de audios")
     ap.add_argument("--names", nargs="*", default=None, help="Nombres base a procesar (sin .mp4). Si no, procesa todos.")
+    ap.add_argument("--workers", type=int, default=1, help="Procesos en paralelo (1 = secuencial)")
+    ap.add_argument("--backend", choices=BACKENDS, default="ffmpeg",
+                    help="ffmpeg (streaming por pipe) o moviepy (camino original)")
     args = ap.parse_args()
 
     vdir = args.videos_dir
@@ -39,11 +121,21 @@ def main():
     if not videos:
         raise SystemExit(f"No se encontraron videos .mp4 en: {vdir}")
 
-    for vp in videos:
-        name = Path(vp).stem.lower()
-        audio_out = os.path.join(out_dir, f"{name}.wav")
-        extract_audio(vp, audio_out)
-        print(f"✅ Audio: {name} -> {audio_out}")
+    def audio_out_for(vp: str) -> str:
+        return os.path.join(out_dir, f"{Path(vp).stem.lower()}.wav")
+
+    if args.workers <= 1:
+        for vp in videos:
+            audio_out = extract_audio(vp, audio_out_for(vp), backend=args.backend)
+            print(f"✅ Audio: {Path(vp).stem.lower()} -> {audio_out}")
+        return
+
+    videos = sort_longest_first(videos)
+    with ProcessPoolExecutor(max_workers=args.workers) as ex:
+        futures = {ex.submit(extract_audio, vp, audio_out_for(vp), args.backend): vp for vp in videos}
+        for fut in as_completed(futures):
+            audio_out = fut.result()
+            print(f"✅ Audio: {Path(futures[fut]).stem.lower()} -> {audio_out}")
 
 
 if __name__ == "__main__":
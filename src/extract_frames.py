@@ -1,11 +1,192 @@
 import os
+import re
+import time
 import argparse
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+from typing import Any, Dict, List, Optional
+
 import cv2
+import numpy as np
 
+from face_roi import HaarFaceDetector, reduce_frame
+from frame_store import DATA_NAME, INDEX_NAME, FrameStoreWriter
+from pipeline_utils import Prefetcher, Timed, WriterPool, rate
+from video_utils import ffmpeg_exe, file_sha256, sort_longest_first, read_json, write_json
 
-def extract_frames(video_path: str, out_dir: str, target_fps: float = 2.0) -> dict:
-    os.makedirs(out_dir, exist_ok=True)
+
+MODES = ("read", "grab", "seek", "auto")
+
+# a partir de esta duración (segundos) el modo "auto" intenta buscar por timestamp
+SEEK_MIN_DURATION = 600.0
+
+MANIFEST_NAME = "manifest.json"
+
+# cada cuántos frames guardados se reescribe el manifest (punto de reanudación)
+CHECKPOINT_EVERY = 200
+
+_FRAME_INDEX_RE = re.compile(r"^frame_(\d+)_t[0-9.]+\.jpg$", re.IGNORECASE)
+
+STORES = ("jpeg", "packed")
+
+# lado fijo de las ROI en frames.u8 (forma única por store) si no se da max_side
+PACKED_ROI_SIDE = 224
+
+
+def frame_name(i: int, t: float) -> str:
+    return f"frame_{i:06d}_t{t:.2f}.jpg"
+
+
+def dhash(frame_bgr, size: int = 8) -> int:
+    """
+    Hash perceptual (difference hash, size*size bits): gris, reduce a (size+1)x size
+    y compara cada pixel con su vecino derecho. Barato y robusto a ruido/compresión.
+    """
+    gray = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def _skip_frames(cap, n: int) -> bool:
+    # avanza n frames sin decodificar
+    for _ in range(n):
+        if not cap.grab():
+            return False
+    return True
+
+
+def _iter_read(cap, step: int, start: int = 0):
+    # loop original: decodifica TODOS los frames y descarta los que no tocan
+    i = start
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if i % step == 0:
+            yield i, frame
+        i += 1
+
+
+def _iter_grab(cap, step: int, start: int = 0):
+    # grab() solo avanza el demuxer; retrieve() decodifica únicamente los frames que se guardan
+    i = start
+    while cap.grab():
+        if i % step == 0:
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            yield i, frame
+        i += 1
+
+
+def _iter_seek(cap, step: int, fps: float, start: int = 0):
+    """
+    Salta directo a cada frame a guardar con CAP_PROP_POS_MSEC.
+    Si el contenedor no respeta el seek (la posición no cae donde se pidió),
+    continúa con grab() desde el último frame bueno. Pasado el último frame el seek
+    también cae en otro lado (OpenCV lo recorta al final): eso es fin de video, no fallback.
+    """
+    n = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)  # 0 = desconocido
+    i = start
+    while True:
+        if n > 0 and i >= n:
+            return
+        if not cap.set(cv2.CAP_PROP_POS_MSEC, i * 1000.0 / fps):
+            break
+        pos = int(round(cap.get(cv2.CAP_PROP_POS_FRAMES)))
+        if pos != i:
+            if (n > 0 and i + step >= n) or not cap.grab():
+                return  # cerca del final (el conteo del contenedor es aproximado) o ya no hay frames
+            break
+        ret, frame = cap.read()
+        if not ret:
+            return
+        yield i, frame
+        i += step
+
+    # fallback: reposiciona al inicio del frame pendiente y avanza secuencialmente
+    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    if not _skip_frames(cap, i):
+        return
+    yield from _iter_grab(cap, step, start=i)
+
+
+def _iter_demux(video_path: str, step: int, start: int, width: int, height: int, audio_out: str):
+    """
+    Una sola pasada de ffmpeg sobre el contenedor con dos salidas:
+      - audio WAV pcm_s16le 16 kHz mono en audio_out (lo que espera transcribe.py)
+      - frames muestreados (n % step == 0, n >= start) como BGR crudo por stdout
+    Con -vsync 0 cada frame seleccionado sale tal cual, así el k-ésimo es n = start + k*step.
+    """
+    os.makedirs(os.path.dirname(audio_out) or ".", exist_ok=True)
+    cmd = [
+        ffmpeg_exe(), "-v", "error", "-nostdin", "-y", "-i", video_path,
+        "-map", "0:a:0", "-ac", "1", "-ar", "16000", "-c:a", "pcm_s16le", audio_out,
+        "-map", "0:v:0",
+        "-vf", f"select='gte(n\\,{start})*not(mod(n\\,{step}))',scale={width}:{height}",
+        "-vsync", "0", "-f", "rawvideo", "-pix_fmt", "bgr24", "pipe:1",
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    frame_bytes = width * height * 3
+    i = start
+    finished = False
+    try:
+        while True:
+            buf = proc.stdout.read(frame_bytes)
+            if len(buf) < frame_bytes:
+                break
+            yield i, np.frombuffer(buf, dtype=np.uint8).reshape(height, width, 3)
+            i += step
+        finished = True
+    finally:
+        proc.stdout.close()
+        if not finished:
+            proc.kill()
+        err = proc.stderr.read().decode("utf-8", errors="replace").strip()
+        proc.stderr.close()
+        code = proc.wait()
+    if code != 0:
+        if "0:a:0" in err or "matches no streams" in err:
+            raise RuntimeError(f"El video no tiene audio: {video_path}")
+        raise RuntimeError(f"ffmpeg falló ({code}) en {video_path}: {err}")
+
+
+def _resolve_mode(cap, mode: str, fps: float) -> str:
+    if mode != "auto":
+        return mode
+    n = cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0.0
+    duration = n / fps if fps > 0 else 0.0
+    return "seek" if duration >= SEEK_MIN_DURATION else "grab"
+
+
+def _iter_sampled(cap, fps: float, step: int, mode: str, start: int = 0):
+    """
+    start: índice del primer frame a considerar (para reanudar); múltiplo de step.
+    """
+    if mode == "seek":
+        return _iter_seek(cap, step, fps, start=start)
+    if mode not in ("read", "grab"):
+        raise ValueError(f"Modo desconocido: {mode} (usa {', '.join(MODES)})")
+    if start and not _skip_frames(cap, start):
+        return iter(())
+    if mode == "read":
+        return _iter_read(cap, step, start=start)
+    return _iter_grab(cap, step, start=start)
+
+
+def open_video(video_path: str, target_fps: float = 2.0, mode: str = "grab"):
+    """
+    Abre el video y resuelve fps/step/modo.
+    Retorna (cap, fps, step, mode); el que llama debe hacer cap.release().
+    """
+    if mode not in MODES:
+        raise ValueError(f"Modo desconocido: {mode} (usa {', '.join(MODES)})")
 
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
@@ -16,22 +197,300 @@ def extract_frames(video_path: str, out_dir: str, target_fps: float = 2.0) -> di
         fps = 30.0  # fallback
 
     step = max(1, int(round(fps / target_fps)))
+    return cap, fps, step, _resolve_mode(cap, mode, fps)
 
-    i = 0
-    saved = 0
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        if i % step == 0:
+
+def iter_frames(video_path: str, target_fps: float = 2.0, mode: str = "grab"):
+    """
+    Generador en memoria: (i, t, frame_bgr) por cada frame muestreado, sin pasar por disco.
+    i es el índice original del frame (el mismo que usa frame_name), t = i / fps.
+    """
+    cap, fps, step, mode = open_video(video_path, target_fps=target_fps, mode=mode)
+    try:
+        for i, frame in _iter_sampled(cap, fps, step, mode):
+            yield i, i / fps, frame
+    finally:
+        cap.release()
+
+
+def load_manifest(frames_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(frames_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    return read_json(path)
+
+
+def _source_stat(video_path: str) -> Dict[str, Any]:
+    st = os.stat(video_path)
+    return {"size": st.st_size, "mtime": st.st_mtime}
+
+
+def _same_source(prev: Dict[str, Any], video_path: str, src: Dict[str, Any]) -> bool:
+    """
+    Compara con la fuente registrada en el manifest: tamaño+mtime iguales basta;
+    si cambió el mtime (copia, touch) decide el hash de contenido. Completa src["sha256"].
+    """
+    psrc = prev.get("source") or {}
+    if psrc.get("size") == src["size"] and psrc.get("mtime") == src["mtime"] and psrc.get("sha256"):
+        src["sha256"] = psrc["sha256"]
+        return True
+    src["sha256"] = file_sha256(video_path)
+    return psrc.get("size") == src["size"] and psrc.get("sha256") == src["sha256"]
+
+
+def _clean_outputs(out_dir: str, keep_upto: Optional[int] = None) -> None:
+    """
+    keep_upto=None: borra todo lo de una extracción anterior (frame_*.jpg y store empaquetado).
+    keep_upto=i: solo borra frame_*.jpg con índice > i (restos posteriores al último checkpoint).
+    """
+    names = {DATA_NAME, INDEX_NAME} if keep_upto is None else set()
+    for fname in os.listdir(out_dir):
+        m = _FRAME_INDEX_RE.match(fname)
+        if m and (keep_upto is None or int(m.group(1)) > keep_upto):
+            names.add(fname)
+    for fname in names:
+        path = os.path.join(out_dir, fname)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _write_manifest(out_dir: str, video_path: str, src: Dict[str, Any], fps: float, step: int,
+                    params: Dict[str, Any], frames: List[Dict[str, Any]], complete: bool) -> None:
+    write_json({
+        "video": video_path,
+        "source": src,
+        "fps": fps,
+        **params,
+        "step": step,
+        "complete": complete,
+        "frames": frames
+    }, os.path.join(out_dir, MANIFEST_NAME))
+
+
+def extract_frames(
+    video_path: str,
+    out_dir: str,
+    target_fps: float = 2.0,
+    mode: str = "grab",
+    dedup_threshold: Optional[int] = None,
+    store: str = "jpeg",
+    force: bool = False,
+    writers: int = 0,
+    queue_size: int = 16,
+    audio_out: Optional[str] = None,
+    max_side: Optional[int] = None,
+    face_roi: bool = False,
+    roi_pad: float = 0.25,
+) -> dict:
+    """
+    mode:
+      - read: cap.read() en cada frame (loop original)
+      - grab: grab() en cada frame y retrieve() solo en los guardados
+      - seek: salta por timestamp (CAP_PROP_POS_MSEC), cae a grab si el contenedor no lo soporta
+      - auto: seek para videos largos, grab en el resto
+
+    dedup_threshold: si se da, un frame cuyo dhash está a <= N bits del último guardado
+    no se escribe; su t queda en "covers" del frame guardado (ver manifest.json).
+
+    store:
+      - jpeg: un frame_XXXXXX_tT.jpg por frame (formato original)
+      - packed: un solo frames.u8 memory-mapped + frames_index.json (ver frame_store.py)
+
+    Incremental: manifest.json guarda tamaño/mtime/sha256 del video y los parámetros.
+    Si nada cambió y está completo se salta; si quedó a medias se reanuda desde
+    el último checkpoint. force=True re-extrae todo.
+
+    writers > 0: un hilo decodifica hacia una cola acotada (queue_size) y `writers` hilos
+    codifican/escriben los JPEG. En info["stages"] queda el throughput por etapa
+    (decode_fps y write_fps por hilo ocupado, wall_fps de punta a punta).
+
+    audio_out: si se da, frames y audio (WAV 16 kHz pcm_s16le) salen de UNA sola
+    lectura del contenedor con ffmpeg (ver _iter_demux) en vez de abrirlo dos veces
+    (extract_frames + extract_audio). OpenCV solo se usa para leer fps/tamaño.
+
+    Salida reducida (para el pipeline facial, que solo necesita la cara):
+      - max_side: guarda los frames con el lado mayor <= max_side
+      - face_roi: guarda solo una ROI cuadrada con padding (roi_pad) alrededor de la cara
+        (Haar cascade). En el manifest quedan orig_size/roi/scale para volver a coordenadas
+        del frame original. Con store packed todas las salidas son cuadradas de max_side
+        (PACKED_ROI_SIDE si no se da): los frames sin ROI van con relleno (offset en el manifest).
+    """
+    if store not in STORES:
+        raise ValueError(f"Store desconocido: {store} (usa {', '.join(STORES)})")
+
+    # frames.u8 tiene una sola forma: ROIs de tamaño variable se deformarían al reescalarlas
+    square = store == "packed" and face_roi
+    if square and not max_side:
+        max_side = PACKED_ROI_SIDE
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    params = {
+        "target_fps": target_fps,
+        "store": store,
+        "dedup_threshold": dedup_threshold,
+        "max_side": max_side,
+        "face_roi": face_roi,
+        "roi_pad": roi_pad if face_roi else None,
+    }
+    src = _source_stat(video_path)
+    prev = None if force else load_manifest(out_dir)
+
+    manifest_frames: List[Dict[str, Any]] = []
+    if prev is not None and all(prev.get(k) == v for k, v in params.items()) and _same_source(prev, video_path, src):
+        manifest_frames = list(prev.get("frames", []))
+        if prev.get("complete") and (audio_out is None or os.path.exists(audio_out)):
+            if prev["source"].get("mtime") != src["mtime"]:
+                _write_manifest(out_dir, video_path, src, prev["fps"], prev["step"], params, manifest_frames, True)
+            return {
+                "video": video_path,
+                "fps": prev["fps"],
+                "saved": len(manifest_frames),
+                "dropped": 0,
+                "out_dir": out_dir,
+                "step": prev["step"],
+                "mode": mode,
+                "store": store,
+                "status": "skipped"
+            }
+    else:
+        if "sha256" not in src:
+            src["sha256"] = file_sha256(video_path)
+        _clean_outputs(out_dir)
+
+    cap, fps, step, mode = open_video(video_path, target_fps=target_fps, mode=mode)
+    if audio_out is not None:
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        cap.release()
+        cap = None
+        mode = "demux"
+
+    packed = None
+    if store == "packed":
+        packed = FrameStoreWriter(out_dir, resume_n=len(manifest_frames))
+        if len(packed) != len(manifest_frames):
+            # el store no tiene lo que dice el manifest: se empieza de cero
+            manifest_frames = []
+
+    detector = HaarFaceDetector() if face_roi else None
+    reduce = bool(max_side) or detector is not None
+
+    start = 0
+    last_hash = None
+    last_roi = None
+    if manifest_frames:
+        # el checkpoint se escribe justo después de guardar un frame: se sigue en el próximo muestreado
+        last = manifest_frames[-1]
+        start = last["i"] + step
+        if last.get("dhash"):
+            last_hash = int(last["dhash"], 16)
+        if last.get("roi"):
+            last_roi = tuple(last["roi"])
+        if store == "jpeg":
+            _clean_outputs(out_dir, keep_upto=last["i"])
+    status = "resumed" if start else "extracted"
+
+    # decodificación (productor) y escritura JPEG (consumidores) en hilos separados si writers > 0
+    if cap is None:
+        # con audio_out: aunque no falten frames (start al final), la pasada escribe el WAV
+        sampled = _iter_demux(video_path, step, start, width, height, audio_out)
+    else:
+        sampled = _iter_sampled(cap, fps, step, mode, start=start)
+    decoder = Prefetcher(sampled, depth=queue_size) if writers > 0 else Timed(sampled)
+    writer = WriterPool(cv2.imwrite, workers=writers, depth=queue_size) if writers > 0 and packed is None else None
+    write_busy = 0.0
+    written = 0
+
+    dropped = 0
+    since_checkpoint = 0
+    t_wall = time.perf_counter()
+    try:
+        for i, frame in decoder:
             t = i / fps
-            name = f"frame_{i:06d}_t{t:.2f}.jpg"
-            cv2.imwrite(os.path.join(out_dir, name), frame)
-            saved += 1
-        i += 1
 
-    cap.release()
-    return {"video": video_path, "fps": fps, "saved": saved, "out_dir": out_dir, "step": step}
+            h = None
+            if dedup_threshold is not None:
+                h = dhash(frame)
+                if last_hash is not None and manifest_frames and hamming(h, last_hash) <= dedup_threshold:
+                    # casi idéntico al último guardado: este lo representa
+                    manifest_frames[-1]["covers"].append(round(t, 2))
+                    dropped += 1
+                    continue
+                last_hash = h
+
+            geom = None
+            if reduce:
+                frame, geom = reduce_frame(frame, max_side=max_side, detector=detector, pad=roi_pad,
+                                           last_roi=last_roi, square=square)
+                if geom["roi"] is not None:
+                    last_roi = tuple(geom["roi"])
+
+            name = frame_name(i, t)
+            if writer is not None:
+                writer.submit(os.path.join(out_dir, name), frame)
+            else:
+                t0 = time.perf_counter()
+                if packed is not None:
+                    packed.append(i, t, frame, name)
+                else:
+                    cv2.imwrite(os.path.join(out_dir, name), frame)
+                write_busy += time.perf_counter() - t0
+                written += 1
+            entry = {"frame": name, "i": i, "t": round(t, 2), "covers": [round(t, 2)]}
+            if h is not None:
+                entry["dhash"] = f"{h:016x}"
+            if geom is not None:
+                entry.update(geom)
+            manifest_frames.append(entry)
+
+            since_checkpoint += 1
+            if since_checkpoint >= CHECKPOINT_EVERY:
+                # el manifest solo puede listar frames que ya están en disco
+                if writer is not None:
+                    writer.join()
+                if packed is not None:
+                    packed.flush()
+                _write_manifest(out_dir, video_path, src, fps, step, params, manifest_frames, False)
+                since_checkpoint = 0
+    finally:
+        decoder.close()
+        if writer is not None:
+            writer.close()
+        if cap is not None:
+            cap.release()
+
+    wall = time.perf_counter() - t_wall
+    if writer is not None:
+        # busy se suma entre hilos: throughput por hilo
+        write_busy, written = writer.busy, writer.count
+
+    if packed is not None:
+        packed.close()
+
+    _write_manifest(out_dir, video_path, src, fps, step, params, manifest_frames, True)
+
+    return {
+        "video": video_path,
+        "fps": fps,
+        "saved": len(manifest_frames),
+        "dropped": dropped,
+        "out_dir": out_dir,
+        "step": step,
+        "mode": mode,
+        "store": store,
+        "status": status,
+        "audio": audio_out,
+        "stages": {
+            "writers": writers,
+            "decoded": decoder.count,
+            "decode_fps": rate(decoder.count, decoder.busy),
+            "written": written,
+            "write_fps": rate(written, write_busy),
+            "wall_s": wall,
+            "wall_fps": rate(decoder.count, wall)
+        }
+    }
 
 
 def main():
@@ -40,6 +499,22 @@ def main():
     ap.add_argument("--out-root", default="data/extracted_frames", help="Carpeta raíz de salida")
     ap.add_argument("--names", nargs="*", default=None, help="Nombres base a procesar (sin .mp4). Si no, procesa todos.")
     ap.add_argument("--target-fps", type=float, default=2.0, help="Frames por segundo a guardar (ej 2.0)")
+    ap.add_argument("--mode", choices=MODES, default="grab",
+                    help="Decodificación: read (todo), grab (solo frames guardados), seek (por timestamp), auto")
+    ap.add_argument("--workers", type=int, default=1, help="Procesos en paralelo (1 = secuencial)")
+    ap.add_argument("--dedup", type=int, default=None, metavar="BITS",
+                    help="Descarta frames casi idénticos al último guardado (distancia dhash <= BITS, ej 4)")
+    ap.add_argument("--store", choices=STORES, default="jpeg",
+                    help="jpeg (un archivo por frame) o packed (frames.u8 memory-mapped + índice)")
+    ap.add_argument("--force", action="store_true", help="Re-extrae aunque el manifest diga que no hubo cambios")
+    ap.add_argument("--writers", type=int, default=0,
+                    help="Hilos de escritura JPEG con decodificación en un hilo aparte (0 = todo en línea)")
+    ap.add_argument("--queue-size", type=int, default=16, help="Tamaño de la cola entre decodificación y escritura")
+    ap.add_argument("--audio-dir", default=None,
+                    help="Si se da, escribe también <nombre>.wav (16 kHz) en esta carpeta en la MISMA lectura del video")
+    ap.add_argument("--max-side", type=int, default=None, help="Lado mayor máximo de los frames guardados (ej 480)")
+    ap.add_argument("--face-roi", action="store_true", help="Guarda solo la ROI de la cara (Haar) en vez del frame completo")
+    ap.add_argument("--roi-pad", type=float, default=0.25, help="Padding de la ROI como fracción del lado de la cara")
     args = ap.parse_args()
 
     vdir = args.videos_dir
@@ -53,11 +528,51 @@ def main():
     if not videos:
         raise SystemExit(f"No se encontraron videos .mp4 en: {vdir}")
 
-    for vp in videos:
-        name = Path(vp).stem
-        out_dir = os.path.join(out_root, name.lower())
-        info = extract_frames(vp, out_dir, target_fps=args.target_fps)
-        print(f"✅ Frames: {name} | fps={info['fps']:.2f} | saved={info['saved']} | out={out_dir}")
+    def report(info: dict) -> None:
+        name = Path(info["video"]).stem
+        print(f"✅ Frames: {name} | {info['status']} | fps={info['fps']:.2f} | saved={info['saved']} | dedup={info['dropped']} | mode={info['mode']} | store={info['store']} | out={info['out_dir']}")
+        if info.get("audio"):
+            print(f"✅ Audio: {name.lower()} -> {info['audio']}")
+        st = info.get("stages")
+        if st:
+            print(f"   etapas: decode={st['decode_fps']:.1f} fps | write={st['write_fps']:.1f} fps"
+                  f" (x{max(1, st['writers'])} hilos) | total={st['wall_fps']:.1f} fps en {st['wall_s']:.1f}s")
+
+    def out_dir_for(vp: str) -> str:
+        return os.path.join(out_root, Path(vp).stem.lower())
+
+    def audio_out_for(vp: str) -> Optional[str]:
+        if not args.audio_dir:
+            return None
+        return os.path.join(args.audio_dir, f"{Path(vp).stem.lower()}.wav")
+
+    opts = {
+        "target_fps": args.target_fps,
+        "mode": args.mode,
+        "dedup_threshold": args.dedup,
+        "store": args.store,
+        "force": args.force,
+        "writers": args.writers,
+        "queue_size": args.queue_size,
+        "max_side": args.max_side,
+        "face_roi": args.face_roi,
+        "roi_pad": args.roi_pad,
+    }
+
+    if args.workers <= 1:
+        for vp in videos:
+            report(extract_frames(vp, out_dir_for(vp), audio_out=audio_out_for(vp), **opts))
+        return
+
+    # los más largos primero: así el último en terminar no es un video largo que arrancó tarde
+    videos = sort_longest_first(videos)
+    with ProcessPoolExecutor(max_workers=args.workers) as ex:
+        futures = [
+            ex.submit(extract_frames, vp, out_dir_for(vp), audio_out=audio_out_for(vp), **opts)
+            for vp in videos
+        ]
+        for fut in as_completed(futures):
+            report(fut.result())
 
 
 if __name__ == "__main__":
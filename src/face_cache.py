@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+DEFAULT_CACHE_DB = ".cache/face_emotions.sqlite"
+
+
+def image_sha256(img) -> str:
+    """
+    Hash de los PIXELES decodificados: vale igual para .jpg, frames.u8 o frames del video.
+    """
+    arr = np.ascontiguousarray(img)
+    h = hashlib.sha256()
+    h.update(f"{arr.shape}:{arr.dtype}".encode("utf-8"))
+    h.update(arr.data)
+    return h.hexdigest()
+
+
+def face_cache_settings() -> Dict[str, Any]:
+    # versión del modelo sin importar deepface (TF) solo para leerla
+    try:
+        from importlib.metadata import version
+        deepface_version = version("deepface")
+    except Exception:
+        deepface_version = None
+    return {"model": "deepface-emotion", "deepface": deepface_version, "detector": "opencv"}
+
+
+class FaceResultCache:
+    """
+    Cache persistente (SQLite) de resultados por frame:
+      clave = sha256(pixeles + settings del modelo + parámetros del análisis)
+    Lecturas sin escribir; los "último uso" y los resultados nuevos se graban juntos
+    en flush() (una transacción), así varios procesos comparten el archivo sin bloquearse.
+    Evicción LRU por tamaño total (max_bytes).
+    El objeto se puede mandar a workers de un ProcessPoolExecutor: la conexión se abre
+    de nuevo en cada proceso.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_DB,
+        settings: Optional[Dict[str, Any]] = None,
+        max_bytes: int = 200 * 1024 * 1024,
+    ):
+        self.path = path
+        self.settings = dict(settings or {})
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._touched: List[str] = []
+        self._pending: List[Tuple[str, str]] = []
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.update({"_conn": None, "_touched": [], "_pending": [], "hits": 0, "misses": 0})
+        return state
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            parent = os.path.dirname(self.path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30.0)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results(last_used)")
+            self._conn.commit()
+        return self._conn
+
+    def key(self, img, **params: Any) -> str:
+        p = json.dumps({**self.settings, **params}, sort_keys=True, ensure_ascii=False)
+        h = hashlib.sha256()
+        h.update(image_sha256(img).encode("utf-8"))
+        h.update(p.encode("utf-8"))
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._db().execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touched.append(key)
+        return json.loads(row[0])
+
+    def put(self, key: str, data: Dict[str, Any]) -> None:
+        self._pending.append((key, json.dumps(data, ensure_ascii=False)))
+
+    def flush(self) -> None:
+        if not self._touched and not self._pending:
+            return
+        now = time.time()
+        db = self._db()
+        with db:
+            db.executemany("UPDATE results SET last_used = ? WHERE key = ?", [(now, k) for k in self._touched])
+            db.executemany(
+                "INSERT OR REPLACE INTO results (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                [(k, v, len(v), now) for k, v in self._pending]
+            )
+        self._touched.clear()
+        self._pending.clear()
+
+    def evict(self) -> Dict[str, int]:
+        self.flush()
+        db = self._db()
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        removed = 0
+        if self.max_bytes > 0 and total > self.max_bytes:
+            doomed = []
+            for key, size in db.execute("SELECT key, size FROM results ORDER BY last_used").fetchall():
+                if total <= self.max_bytes:
+                    break
+                doomed.append((key,))
+                total -= size
+            with db:
+                db.executemany("DELETE FROM results WHERE key = ?", doomed)
+            removed = len(doomed)
+        n = db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return {"removed": removed, "entries": n, "bytes": total}
+
+    def close(self) -> None:
+        self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
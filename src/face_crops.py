@@ -0,0 +1,128 @@
+import os
+import argparse
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from emotion_backend import DEEPFACE, EMOTION_INPUT, get_emotion_backend, scores_from_probs
+from frame_store import PackedArray, PackedWriter, has_packed
+from video_utils import list_subdirs, write_json
+
+
+CROPS_NAME = "face_crops.u8"
+CROPS_INDEX_NAME = "face_crops_index.json"
+DEFAULT_CROPS_ROOT = "data/face_crops"
+
+
+def has_face_crops(crops_dir: str) -> bool:
+    return has_packed(crops_dir, CROPS_NAME, CROPS_INDEX_NAME)
+
+
+class FaceCropWriter(PackedWriter):
+    """
+    Recortes de cara detectados y alineados, tal como entran al clasificador
+    (gris, 48x48, uint8), en un solo archivo (N, 48, 48) + índice JSON con
+    (t, frame, caja en el frame original) por recorte y los settings con que se obtuvieron.
+    Se llena con take(items) a partir de items con "_crop" (analyze_frames(keep_crops=True));
+    los frames sin cara (detector sin resultado y enforce_detection=False) no se guardan.
+    Al reabrir con los mismos settings conserva lo ya guardado y no repite frames;
+    con otros settings empieza de cero. Se puede mandar a un worker: el archivo se abre allá.
+    """
+
+    def __init__(self, out_dir: str, settings: Optional[Dict[str, Any]] = None):
+        super().__init__(out_dir, CROPS_NAME, CROPS_INDEX_NAME, ("t", "frames", "boxes"),
+                         shape=(EMOTION_INPUT, EMOTION_INPUT), extra={"settings": dict(settings or {})})
+        self._seen = set()
+
+    @property
+    def settings(self) -> Dict[str, Any]:
+        return self.extra["settings"]
+
+    def _open(self) -> None:
+        if self._f is None:
+            idx = self.read_index()
+            same = idx is not None and idx.get("settings") == self.settings
+            self.open(int(idx.get("n", 0)) if same else 0)
+            self._seen = set(self.cols["frames"])
+
+    def take(self, items: Iterable[Dict[str, Any]]) -> None:
+        """
+        Saca "_crop" de cada item (no debe llegar al JSON) y lo guarda; luego checkpoint.
+        """
+        self._open()
+        for it in items:
+            crop = it.pop("_crop", None)
+            if crop is None or it["frame"] in self._seen:
+                continue
+            if it.get("face_detected") is False or ("roi_source" in it and it.get("roi") is None):
+                continue  # sin cara detectada / seguida: sería el frame completo, no una cara
+            self.write(crop, t=it.get("t"), frames=it["frame"], boxes=it.get("face_box") or it.get("roi"))
+            self._seen.add(it["frame"])
+        self.flush()
+
+
+class FaceCropStore(PackedArray):
+    """
+    Lector: np.memmap sobre face_crops.u8. inputs() da el lote listo para el clasificador
+    (float32 en [0, 1], forma (n, 48, 48, 1)), sin detector ni JPEG.
+    """
+
+    def __init__(self, crops_dir: str):
+        super().__init__(crops_dir, CROPS_NAME, CROPS_INDEX_NAME, empty_shape=(EMOTION_INPUT, EMOTION_INPUT))
+        self.crops_dir = crops_dir
+        self.crops = self.data
+        self.settings: Dict[str, Any] = self.idx.get("settings") or {}
+        self.t: List[Optional[float]] = self.column("t")
+        self.names: List[str] = self.column("frames")
+        self.boxes: List[Optional[List[int]]] = self.column("boxes")
+
+    def inputs(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        return (np.asarray(self.crops[start:stop], dtype=np.float32) / 255.0)[..., None]
+
+
+def rescore_crops(crops_dir: str, backend: str = DEEPFACE, batch_size: int = 64) -> Dict[str, Any]:
+    """
+    Vuelve a clasificar los recortes guardados (otro backend / modelo) y devuelve la misma
+    serie temporal que analyze_frames_dir: items [{t, frame, dominant_emotion, scores, face_box}].
+    """
+    store = FaceCropStore(crops_dir)
+    model = get_emotion_backend(backend)
+    items: List[Dict[str, Any]] = []
+    for k in range(0, len(store), batch_size):
+        preds = model.predict(store.inputs(k, k + batch_size))
+        for j, p in enumerate(preds, start=k):
+            items.append({"t": store.t[j], "frame": store.names[j], **scores_from_probs(p),
+                          "face_box": store.boxes[j]})
+    items.sort(key=lambda x: (x["t"] is None, x["t"] if x["t"] is not None else 0.0, x["frame"]))
+    return {
+        "frames_dir": None,
+        "crops_dir": crops_dir,
+        "n_frames": len(items),
+        "items": items,
+        "settings": store.settings,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Re-clasifica los recortes de cara guardados (sin detector ni JPEG)")
+    ap.add_argument("--crops-root", default=DEFAULT_CROPS_ROOT, help="Carpeta con subcarpetas de recortes por video")
+    ap.add_argument("--video-folder", default=None, help="Subcarpeta a procesar. Si no se da, procesa todas.")
+    ap.add_argument("--out-dir", default="outputs/face_emotions", help="Carpeta de salida (*_face_timeseries.json)")
+    ap.add_argument("--backend", default=DEEPFACE, help="deepface o ruta a un .onnx")
+    ap.add_argument("--batch-size", type=int, default=64)
+    args = ap.parse_args()
+
+    targets = [args.video_folder] if args.video_folder else list_subdirs(args.crops_root)
+    targets = [t for t in targets if has_face_crops(os.path.join(args.crops_root, t))]
+    if not targets:
+        raise SystemExit(f"No hay recortes guardados en: {args.crops_root}")
+
+    for name in targets:
+        data = rescore_crops(os.path.join(args.crops_root, name), backend=args.backend, batch_size=args.batch_size)
+        out_path = os.path.join(args.out_dir, f"{name}_face_timeseries.json")
+        write_json(data, out_path)
+        print(f"✅ {name}: {data['n_frames']} recortes -> {out_path}")
+
+
+if __name__ == "__main__":
+    main()
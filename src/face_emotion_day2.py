@@ -1,11 +1,35 @@
 import os
 import re
 import json
-from typing import Dict, List, Optional, Any
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+from typing import Dict, List, Optional, Any, Iterable, Tuple
 
 import cv2
-from deepface import DeepFace
+import numpy as np
 
+from adaptive_sampling import coarse_step, interpolate, needs_refine, refine
+from extract_frames import iter_frames, frame_name, load_manifest
+from frame_store import FrameStore, has_frame_store
+from face_cache import FaceResultCache
+from face_crops import FaceCropWriter
+from face_journal import FaceJournal
+from emotion_backend import DEEPFACE, EMOTION_INPUT, backend_fingerprint, get_emotion_backend, scores_from_probs
+from face_roi import FaceTracker
+from model_server import ModelClient
+from pipeline_utils import OrderedMap, Prefetcher
+from video_utils import default_cpu_threads
+
+
+# frames por pedido al servidor de modelos (--server)
+SERVER_BATCH = 16
+
+# frames por tarea al repartir una carpeta entre procesos (--workers)
+SHARD_FRAMES = 64
+
+# frames por tanda que se agrega al journal sin --workers (con pool: tandas de SHARD_FRAMES)
+JOURNAL_CHUNK = 256
 
 _TIME_RE = re.compile(r"_t([0-9]+(?:\.[0-9]+)?)\.jpg$", re.IGNORECASE)
 
@@ -39,18 +63,662 @@ def _to_float_dict(d: Dict[str, Any]) -> Dict[str, Any]:
     return out
 
 
+_NO_IMAGE = "Imagen no pudo cargarse (cv2.imread devolvió None)"
+
+
+def _face_found(face: Dict[str, Any], img) -> bool:
+    """
+    Sin enforce_detection, si el detector no encuentra cara DeepFace sigue con la imagen
+    completa: confianza 0 y/o región = imagen entera. face: item de extract_faces o de analyze.
+    """
+    conf = face.get("confidence", face.get("face_confidence"))
+    if conf is not None and float(conf) <= 0.0:
+        return False
+    area = face.get("facial_area") or face.get("region") or {}
+    h, w = img.shape[:2]
+    return not (area.get("x", 0) == 0 and area.get("y", 0) == 0 and area.get("w") == w and area.get("h") == h)
+
+
+def _analyze_image(img, enhance: bool, enforce_detection: bool) -> Dict[str, Any]:
+    if img is None:
+        raise ValueError(_NO_IMAGE)
+
+    if enhance:
+        img = _enhance_clahe_bgr(img)
+
+    from deepface import DeepFace  # import pesado (TF): con --server no se carga en el cliente
+
+    r = DeepFace.analyze(
+        img_path=img,
+        actions=["emotion"],
+        enforce_detection=enforce_detection,
+    )
+    if isinstance(r, list):
+        r = r[0]
+
+    return {
+        "dominant_emotion": r.get("dominant_emotion"),
+        "scores": _to_float_dict(r.get("emotion", {})),
+        "face_detected": _face_found(r, img)
+    }
+
+
+# --- camino por lotes: detección por frame + UNA pasada del CNN de emociones por lote ---
+
+def _letterbox_gray(gray):
+    # cuadrada con relleno negro (como resize_image de DeepFace) y a 48x48
+    h, w = gray.shape[:2]
+    side = max(h, w)
+    sq = np.zeros((side, side), dtype=np.float32)
+    y0, x0 = (side - h) // 2, (side - w) // 2
+    sq[y0:y0 + h, x0:x0 + w] = gray
+    return cv2.resize(sq, (EMOTION_INPUT, EMOTION_INPUT))
+
+
+def _face_crop(img_bgr, enforce_detection: bool) -> Tuple[Any, Optional[List[int]], bool]:
+    """
+    Detecta y alinea la cara como DeepFace.analyze (primera cara, detector opencv) y la deja
+    como la espera el modelo: gris, cuadrada con relleno negro, 48x48, valores en [0, 1].
+    Retorna también la caja [x, y, w, h] en la imagen (None si DeepFace no la da) y si hubo
+    cara (False = sin enforce_detection, "recorte" de la imagen completa).
+    """
+    from deepface import DeepFace
+
+    faces = DeepFace.extract_faces(
+        img_path=img_bgr,
+        detector_backend="opencv",
+        enforce_detection=enforce_detection,
+        align=True,
+    )
+    face = np.asarray(faces[0]["face"], dtype=np.float32)  # RGB en [0, 1]
+    if face.max() > 1.0:
+        face = face / 255.0
+    area = faces[0].get("facial_area") or {}
+    box = [int(area[k]) for k in ("x", "y", "w", "h")] if all(k in area for k in ("x", "y", "w", "h")) else None
+    gray = _letterbox_gray(cv2.cvtColor(np.ascontiguousarray(face[:, :, ::-1]), cv2.COLOR_BGR2GRAY))
+    return gray, box, _face_found(faces[0], img_bgr)
+
+
+def _face_crop_gray(img_bgr, enforce_detection: bool):
+    return _face_crop(img_bgr, enforce_detection)[0]
+
+
+def _crop_gray(crop_bgr):
+    # recorte ya ubicado (tracking): sin detector ni alineación
+    return _letterbox_gray(cv2.cvtColor(crop_bgr, cv2.COLOR_BGR2GRAY).astype(np.float32) / 255.0)
+
+
+def _classify_batched(imgs: List[Any], to_input, backend: str = DEEPFACE,
+                      keep_crops: bool = False) -> List[Dict[str, Any]]:
+    # to_input(img) -> (entrada 48x48 en [0, 1], caja o None, cara detectada o None si no aplica)
+    out: List[Optional[Dict[str, Any]]] = [None] * len(imgs)
+    inputs, idx, boxes, found = [], [], [], []
+    for k, img in enumerate(imgs):
+        try:
+            if img is None:
+                raise ValueError(_NO_IMAGE)
+            x, box, detected = to_input(img)
+            inputs.append(x)
+            boxes.append(box)
+            found.append(detected)
+            idx.append(k)
+        except Exception as e:
+            out[k] = {"error": str(e)}
+
+    if inputs:
+        try:
+            preds = get_emotion_backend(backend).predict(np.stack(inputs)[..., None])
+        except Exception as e:
+            for k in idx:
+                out[k] = {"error": str(e)}
+            return out
+        for k, p, x, box, detected in zip(idx, preds, inputs, boxes, found):
+            out[k] = scores_from_probs(p)
+            if detected is not None:
+                out[k]["face_detected"] = detected
+            if keep_crops and detected is not False:
+                # para FaceCropWriter: sale del item antes de llegar al JSON. Sin cara el
+                # "recorte" es la imagen completa: no se guarda como cara
+                out[k]["_crop"] = np.round(x * 255.0).astype(np.uint8)
+                if box is not None:
+                    out[k]["face_box"] = box
+    return out
+
+
+def analyze_images_batched(imgs: List[Any], enforce_detection: bool = False,
+                           backend: str = DEEPFACE, keep_crops: bool = False) -> List[Dict[str, Any]]:
+    """
+    Una entrada por imagen: {dominant_emotion, scores} (scores en %, como DeepFace.analyze)
+    o {error}. Las imágenes ya vienen mejoradas (CLAHE) si corresponde.
+    backend: "deepface" (Keras) o ruta a un .onnx (ver emotion_backend.py).
+    keep_crops: agrega "_crop" (48x48 uint8) y "face_box" a cada resultado.
+    """
+    return _classify_batched(imgs, lambda img: _face_crop(img, enforce_detection), backend, keep_crops)
+
+
+def analyze_crops_batched(crops: List[Any], backend: str = DEEPFACE,
+                          keep_crops: bool = False) -> List[Dict[str, Any]]:
+    """
+    Igual que analyze_images_batched pero sobre recortes de cara ya ubicados (modo tracking).
+    """
+    return _classify_batched(crops, lambda c: (_crop_gray(c), None, None), backend, keep_crops)
+
+
+def _analyze_images(imgs: List[Any], enforce_detection: bool) -> List[Dict[str, Any]]:
+    # DeepFace.analyze por imagen, con la interfaz de run(imgs) de _analyze_in_batches
+    out = []
+    for img in imgs:
+        try:
+            out.append(_analyze_image(img, False, enforce_detection))
+        except Exception as e:
+            out.append({"error": str(e)})
+    return out
+
+
+# --- cascada: primero el frame reducido sin CLAHE; resolución completa + CLAHE solo si hace falta ---
+
+def _score_margin(r: Dict[str, Any]) -> float:
+    # diferencia (puntos %) entre la 1ª y 2ª emoción; un error o un frame donde no se encontró
+    # cara (se clasificó la imagen reducida entera) siempre pasan al tier completo
+    if "error" in r or r.get("face_detected") is False:
+        return float("-inf")
+    top = sorted((float(v) for v in (r.get("scores") or {}).values()), reverse=True)
+    return top[0] - top[1] if len(top) > 1 else float("-inf")
+
+
+def _downscale(img, scale: float):
+    if scale >= 1.0:
+        return img
+    return cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def _cascade(run, enhance: bool, scale: float, margin: float):
+    """
+    Envuelve run(imgs): analiza las imágenes reducidas (scale) sin CLAHE y re-analiza a
+    resolución completa (con CLAHE si enhance) las que quedan con margen < margin.
+    Cada resultado lleva "tier": "low" o "full".
+    """
+    def cascaded(imgs: List[Any]) -> List[Dict[str, Any]]:
+        out = [{**r, "tier": "low"} for r in run([_downscale(img, scale) for img in imgs])]
+        for r in out:
+            if r.get("face_box") and scale < 1.0:
+                r["face_box"] = [int(round(v / scale)) for v in r["face_box"]]  # a coordenadas del frame
+        redo = [k for k, r in enumerate(out) if _score_margin(r) < margin]
+        if redo:
+            full = run([_enhance_clahe_bgr(imgs[k]) if enhance else imgs[k] for k in redo])
+            for k, r in zip(redo, full):
+                out[k] = {**r, "tier": "full"}
+        return out
+
+    return cascaded
+
+
+def _sort_items(items: List[Dict[str, Any]]) -> None:
+    # ordenar por tiempo si existe; si t es None, queda al final por frame name
+    items.sort(key=lambda x: (x["t"] is None, x["t"] if x["t"] is not None else 0.0, x["frame"]))
+
+
+def _track_crop(tracker: FaceTracker, img, enforce_detection: bool) -> Tuple[Any, Dict[str, Any]]:
+    box, source = tracker.update(img)
+    if box is None:
+        if enforce_detection:
+            raise ValueError("No se detectó rostro en el frame")
+        return img, {"roi": None, "roi_source": source}  # como DeepFace sin enforce: frame completo
+    x, y, w, h = box
+    return img[y:y + h, x:x + w], {"roi": list(box), "roi_source": source}
+
+
+def _analyze_in_batches(
+    frames: Iterable[Tuple[Optional[float], str, Any]],
+    enhance: bool,
+    batch_size: int,
+    run,
+    tracker: Optional[FaceTracker] = None,
+    enforce_detection: bool = False,
+) -> List[Dict[str, Any]]:
+    # CLAHE por frame (o por recorte con tracker); run(imgs) -> un resultado ({...} o {error}) por imagen
+    items: List[Dict[str, Any]] = []
+    batch: List[Tuple[Optional[float], str, Any, Dict[str, Any]]] = []
+
+    def flush():
+        try:
+            results = run([img for _, _, img, _ in batch])
+        except Exception as e:
+            # servidor caído / timeout: el lote queda con error y se sigue, como con un frame malo
+            results = [{"error": str(e)}] * len(batch)
+        for (t, fname, _, extra), r in zip(batch, results):
+            items.append({"t": t, "frame": fname, **r, **extra})
+        batch.clear()
+
+    for t, fname, img in frames:
+        if img is None:
+            items.append({"t": t, "frame": fname, "error": _NO_IMAGE})
+            continue
+        extra: Dict[str, Any] = {}
+        if tracker is not None:
+            try:
+                img, extra = _track_crop(tracker, img, enforce_detection)
+            except Exception as e:
+                items.append({"t": t, "frame": fname, "error": str(e)})
+                continue
+        batch.append((t, fname, _enhance_clahe_bgr(img) if enhance else img, extra))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return items
+
+
+def analyze_frames(
+    frames: Iterable[Tuple[Optional[float], str, Any]],
+    enhance: bool = True,
+    enforce_detection: bool = False,
+    server: Optional[str] = None,
+    batch_size: int = 0,
+    track: bool = False,
+    keyframe_every: int = 15,
+    cache: Optional[FaceResultCache] = None,
+    prefetch: int = 0,
+    prefetch_workers: int = 4,
+    backend: str = DEEPFACE,
+    cascade_margin: float = 0.0,
+    cascade_scale: float = 0.5,
+    keep_crops: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Núcleo común: recibe (t, frame_name, img_bgr) y devuelve items
+    [{t, frame, dominant_emotion, scores}] o {t, frame, error} por frame.
+    img_bgr puede ser None (no se pudo cargar) y queda como error.
+    server: URL del servidor de modelos (model_server.py); si se da, DeepFace corre allá.
+    batch_size > 1: detecta por frame y clasifica los recortes en lotes (una pasada por lote).
+    track: detecta solo en keyframes (cada keyframe_every frames o si el seguimiento pierde
+    confianza) y entre medio sigue la caja; se clasifica solo el recorte. Agrega roi y roi_source.
+    cache (FaceResultCache): reutiliza resultados de frames ya analizados con los mismos
+    parámetros (no aplica con track: el resultado depende de los frames anteriores).
+    prefetch > 0: lectura + CLAHE en prefetch_workers hilos, hasta `prefetch` frames por
+    delante del modelo. img_bgr puede ser entonces una función sin argumentos que la carga.
+    backend: "deepface" o ruta a un .onnx (ONNX Runtime, CPU). El ONNX solo existe en el
+    camino por lotes: si batch_size <= 1 se usa SERVER_BATCH.
+    cascade_margin > 0: cada frame se analiza primero reducido (cascade_scale) y sin CLAHE;
+    si la diferencia entre las dos emociones principales (puntos %) queda bajo cascade_margin,
+    se repite a resolución completa con CLAHE. Agrega "tier": "low" | "full". No aplica con track.
+    keep_crops: cada item trae "_crop" (recorte 48x48 uint8) y "face_box" para FaceCropWriter;
+    usa el camino por lotes, local (no con server) y sin cache de resultados.
+    """
+    keep_crops = keep_crops and not server
+    if (backend != DEEPFACE or keep_crops) and batch_size <= 1:
+        batch_size = SERVER_BATCH
+    cascade = cascade_margin > 0 and not track
+
+    if prefetch > 0:
+        # con track el CLAHE va sobre el recorte, no sobre el frame completo;
+        # con cascada solo sobre los frames que pasan al tier completo
+        pre_enhance = enhance and not track and not cascade
+        frames = OrderedMap(partial(_prepare_frame, enhance=pre_enhance), frames,
+                            workers=prefetch_workers, depth=prefetch)
+        enhance = enhance and not pre_enhance
+
+    if cache is not None and not track and not keep_crops:
+        # con server los resultados son del modelo del servidor, no del backend local
+        model_id = ModelClient(server).face_backend() if server else backend_fingerprint(backend)
+        if model_id is not None:  # servidor sin responder: sin cache (no se sabe qué modelo corre)
+            return _analyze_cached(frames, enhance, enforce_detection, server, batch_size, cache, backend,
+                                   model_id, cascade_margin, cascade_scale)
+
+    tracker = FaceTracker(keyframe_every=keyframe_every) if track else None
+    size = batch_size if batch_size > 1 else SERVER_BATCH
+
+    if cascade:
+        if server:
+            client = ModelClient(server)
+            run = lambda imgs: client.analyze_faces(imgs, enforce_detection)
+        elif batch_size > 1:
+            run = lambda imgs: analyze_images_batched(imgs, enforce_detection, backend, keep_crops)
+        else:
+            run = lambda imgs: _analyze_images(imgs, enforce_detection)
+        items = _analyze_in_batches(frames, False, size, _cascade(run, enhance, cascade_scale, cascade_margin))
+        _sort_items(items)
+        return items
+
+    if server:
+        client = ModelClient(server)
+        items = _analyze_in_batches(frames, enhance, size,
+                                    lambda imgs: client.analyze_faces(imgs, enforce_detection, crops=track),
+                                    tracker, enforce_detection)
+        _sort_items(items)
+        return items
+
+    if track:
+        items = _analyze_in_batches(frames, enhance, size,
+                                    lambda imgs: analyze_crops_batched(imgs, backend, keep_crops),
+                                    tracker, enforce_detection)
+        _sort_items(items)
+        return items
+
+    if batch_size > 1:
+        items = _analyze_in_batches(frames, enhance, batch_size,
+                                    lambda imgs: analyze_images_batched(imgs, enforce_detection, backend, keep_crops))
+        _sort_items(items)
+        return items
+
+    items: List[Dict[str, Any]] = []
+
+    for t, fname, img in frames:
+        try:
+            items.append({"t": t, "frame": fname, **_analyze_image(img, enhance, enforce_detection)})
+        except Exception as e:
+            # No se cae el pipeline: registra error y continúa
+            items.append({
+                "t": t,
+                "frame": fname,
+                "error": str(e)
+            })
+
+    _sort_items(items)
+    return items
+
+
+def _prepare_frame(frame: Tuple[Optional[float], str, Any], enhance: bool):
+    t, fname, img = frame
+    if callable(img):
+        img = img()
+    if img is not None and enhance:
+        img = _enhance_clahe_bgr(img)
+    return t, fname, img
+
+
+def _analyze_cached(frames, enhance: bool, enforce_detection: bool, server: Optional[str],
+                    batch_size: int, cache: FaceResultCache, backend: str = DEEPFACE,
+                    model_id: str = DEEPFACE, cascade_margin: float = 0.0,
+                    cascade_scale: float = 0.5) -> List[Dict[str, Any]]:
+    # server y batch_size > 1 usan el mismo camino (detección + CNN por lotes);
+    # model_id: backend_fingerprint del modelo que realmente clasifica (local o del servidor)
+    params = {"enhance": enhance, "enforce_detection": enforce_detection,
+              "path": "batched" if (server or batch_size > 1) else "analyze",
+              "backend": model_id}
+    if cascade_margin > 0:
+        params["cascade"] = [cascade_margin, cascade_scale]
+    hits: List[Dict[str, Any]] = []
+    keys: Dict[str, str] = {}
+
+    def misses():
+        for t, fname, img in frames:
+            if img is not None:
+                k = cache.key(img, **params)
+                r = cache.get(k)
+                if r is not None and "face_detected" in r:  # sin face_detected: guardado antes, se rehace
+                    hits.append({"t": t, "frame": fname, **r})
+                    continue
+                keys[fname] = k
+            yield t, fname, img
+
+    items = analyze_frames(misses(), enhance=enhance, enforce_detection=enforce_detection,
+                           server=server, batch_size=batch_size, backend=backend,
+                           cascade_margin=cascade_margin, cascade_scale=cascade_scale)
+    for it in items:
+        k = keys.get(it["frame"])
+        if k and "error" not in it:  # los errores no se guardan: pueden ser transitorios
+            r = {"dominant_emotion": it.get("dominant_emotion"), "scores": it.get("scores"),
+                 "face_detected": it.get("face_detected")}
+            if "tier" in it:
+                r["tier"] = it["tier"]
+            cache.put(k, r)
+    cache.flush()
+
+    items.extend(hits)
+    _sort_items(items)
+    return items
+
+
+# --- multiproceso: cada worker carga DeepFace una vez y usa pocos hilos de TF ---
+
+def _pin_tf_threads(threads: int) -> None:
+    # antes de que TF cree su runtime; si no, cada proceso usa todos los núcleos
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    try:
+        import tensorflow as tf
+
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    except Exception:
+        pass  # TF ya inicializado: quedan las variables de entorno
+
+
+def _init_face_worker(tf_threads: int, backend: str = DEEPFACE) -> None:
+    _pin_tf_threads(tf_threads)
+    if backend != DEEPFACE:
+        get_emotion_backend(backend, threads=tf_threads)  # ONNX Runtime con los mismos hilos
+    # warm-up: detector + modelo de emociones quedan cargados para todo el proceso
+    analyze_images_batched([np.zeros((64, 64, 3), dtype=np.uint8)], backend=backend)
+
+
+def make_face_pool(workers: int, tf_threads: int = 0, backend: str = DEEPFACE) -> ProcessPoolExecutor:
+    """
+    Pool de procesos para analyze_frames_dir(pool=...) / analyze_video.
+    tf_threads: hilos de TF por worker (0 = núcleos / workers).
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_face_worker,
+        initargs=(tf_threads or default_cpu_threads(workers), backend)
+    )
+
+
+def _analyze_shard(frames_dir: str, keys: List[Any], packed: bool, enhance: bool,
+                   enforce_detection: bool, opts: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Tuple[int, int]]:
+    # corre en el worker: keys son posiciones del frames.u8 o nombres de .jpg; retorna (items, (hits, misses))
+    if packed:
+        store = FrameStore(frames_dir)
+        frames = _iter_store_frames(store, keys, lazy=bool(opts.get("prefetch")))
+    else:
+        frames = _iter_dir_frames(frames_dir, keys, lazy=bool(opts.get("prefetch")))
+    items = analyze_frames(frames, enhance=enhance, enforce_detection=enforce_detection, **opts)
+    cache = opts.get("cache")
+    return items, ((cache.hits, cache.misses) if cache is not None else (0, 0))
+
+
+def _iter_sharded(pool: ProcessPoolExecutor, frames_dir: str, keys: List[Any], packed: bool,
+                  enhance: bool, enforce_detection: bool, opts: Dict[str, Any]) -> Iterable[List[Dict[str, Any]]]:
+    # todas las tandas se encolan de entrada (el pool nunca espera) y se entregan en orden
+    futures = [
+        pool.submit(_analyze_shard, frames_dir, keys[k:k + SHARD_FRAMES], packed, enhance, enforce_detection, opts)
+        for k in range(0, len(keys), SHARD_FRAMES)
+    ]
+    cache = opts.get("cache")
+    try:
+        for fut in futures:
+            part, (hits, misses) = fut.result()
+            if cache is not None:
+                # cada worker tiene su copia del cache: los contadores se suman acá
+                cache.hits += hits
+                cache.misses += misses
+            yield part  # los errores por frame ya vienen como items
+    finally:
+        for fut in futures:
+            fut.cancel()
+
+
+def _analyze_sharded(pool: ProcessPoolExecutor, frames_dir: str, keys: List[Any], packed: bool,
+                     enhance: bool, enforce_detection: bool, opts: Dict[str, Any]) -> List[Dict[str, Any]]:
+    items: List[Dict[str, Any]] = []
+    for part in _iter_sharded(pool, frames_dir, keys, packed, enhance, enforce_detection, opts):
+        items.extend(part)
+    _sort_items(items)
+    return items
+
+
+def _iter_dir_frames(frames_dir: str, frames: List[str], lazy: bool = False):
+    # lazy: entrega el "cargador" en vez de la imagen, para leer en los hilos de prefetch
+    for fname in frames:
+        t = _frame_time_from_name(fname)  # preferido (porque ya lo tienes en el nombre)
+        path = os.path.join(frames_dir, fname)
+        yield t, fname, (partial(cv2.imread, path) if lazy else cv2.imread(path))
+
+
+def _iter_store_frames(store: FrameStore, keys: Iterable[int], lazy: bool = False):
+    # np.array copia desde el memmap: con lazy, la lectura de disco pasa en el hilo de prefetch
+    for k in keys:
+        yield store.t[k], store.names[k], (partial(np.array, store[k]) if lazy else store[k])
+
+
+def _attach_covers(items: List[Dict[str, Any]], manifest: Optional[Dict[str, Any]]) -> None:
+    """
+    Si la extracción deduplicó frames, cada item lleva "covers": los t que representa,
+    para que la sincronización pueda expandirlo a la grilla temporal completa.
+    """
+    if not manifest:
+        return
+    covers = {m["frame"]: m.get("covers") or [] for m in manifest.get("frames", [])}
+    for it in items:
+        c = covers.get(it["frame"])
+        if c and len(c) > 1:
+            it["covers"] = c
+
+
+def _analyze_keys(frames_dir: str, store: Optional[FrameStore], keys: List[Any], enhance: bool,
+                  enforce_detection: bool, pool: Optional[ProcessPoolExecutor],
+                  opts: Dict[str, Any], crops: Optional[FaceCropWriter] = None) -> List[Dict[str, Any]]:
+    # keys: posiciones del frames.u8 (store) o nombres de .jpg
+    if pool is not None and not opts.get("server"):
+        # cada worker abre su propio memmap / lee sus .jpg: solo viajan las claves
+        items = _analyze_sharded(pool, frames_dir, keys, store is not None, enhance, enforce_detection, opts)
+    else:
+        lazy = bool(opts.get("prefetch"))
+        frames = _iter_store_frames(store, keys, lazy) if store is not None else \
+            _iter_dir_frames(frames_dir, keys, lazy)
+        items = analyze_frames(frames, enhance=enhance, enforce_detection=enforce_detection, **opts)
+    if crops is not None:
+        crops.take(items)  # en el proceso principal: los workers devuelven los recortes en los items
+    return items
+
+
+def _analyze_adaptive(frames_dir: str, store: Optional[FrameStore], keys: List[Any], names: List[str],
+                      times: List[Optional[float]], enhance: bool, enforce_detection: bool,
+                      pool: Optional[ProcessPoolExecutor], opts: Dict[str, Any],
+                      coarse_fps: float, min_confidence: float,
+                      crops: Optional[FaceCropWriter] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Muestreo grueso a fino: analiza ~coarse_fps y refina (bisección) solo donde los vecinos
+    difieren o la confianza es baja; el resto se interpola ("interpolated": true).
+    """
+    # el seguimiento necesita frames consecutivos: acá se analizan salteados
+    opts = {k: v for k, v in opts.items() if k != "track"}
+
+    def analyze(idx: List[int]) -> Dict[int, Dict[str, Any]]:
+        items = _analyze_keys(frames_dir, store, [keys[i] for i in idx], enhance, enforce_detection, pool, opts,
+                              crops)
+        by_name = {it["frame"]: it for it in items}
+        return {i: by_name[names[i]] for i in idx}
+
+    step = coarse_step(times, coarse_fps)
+    done = refine(len(keys), step, analyze, lambda a, b: needs_refine(a, b, min_confidence))
+    analyzed = sorted(done)
+    items = [
+        done[i] if i in done else {"t": times[i], "frame": names[i], **interpolate(i, times, done, analyzed)}
+        for i in range(len(keys))
+    ]
+    summary = {
+        "coarse_fps": coarse_fps,
+        "coarse_step": step,
+        "min_confidence": min_confidence,
+        "analyzed": len(done),
+        "interpolated": len(keys) - len(done),
+    }
+    return items, summary
+
+
+def _analyze_journaled(frames_dir: str, store: Optional[FrameStore], keys: List[Any], names: List[str],
+                       enhance: bool, enforce_detection: bool, pool: Optional[ProcessPoolExecutor],
+                       opts: Dict[str, Any], journal: FaceJournal, crops: Optional[FaceCropWriter] = None) -> int:
+    """
+    Analiza en tandas de JOURNAL_CHUNK frames y agrega cada tanda al journal (sin juntar
+    los items en memoria). Retoma salteando los frames que ya están. Retorna cuántos había.
+    Con pool se encolan todas las tandas de SHARD_FRAMES de una vez y se agregan en orden
+    a medida que terminan, así los workers no esperan al final de cada tanda.
+    """
+    done = journal.done()
+    todo = [k for k, name in zip(keys, names) if name not in done]
+    manifest = load_manifest(frames_dir)
+    if pool is not None and not opts.get("server"):
+        parts = _iter_sharded(pool, frames_dir, todo, store is not None, enhance, enforce_detection, opts)
+    else:
+        parts = (_analyze_keys(frames_dir, store, todo[k:k + JOURNAL_CHUNK], enhance, enforce_detection, None, opts)
+                 for k in range(0, len(todo), JOURNAL_CHUNK))
+    try:
+        for part in parts:
+            if crops is not None:
+                crops.take(part)
+            _attach_covers(part, manifest)
+            journal.append(part)
+    finally:
+        journal.close()
+    return len(done)
+
+
+def _analyze_indexed(frames_dir: str, store: Optional[FrameStore], keys: List[Any], names: List[str],
+                     times: List[Optional[float]], enhance: bool, enforce_detection: bool,
+                     pool: Optional[ProcessPoolExecutor], coarse_fps: float, min_confidence: float,
+                     journal: Optional[FaceJournal], crops: Optional[FaceCropWriter],
+                     opts: Dict[str, Any]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {"frames_dir": frames_dir, "n_frames": len(keys)}
+    if crops is not None:
+        opts = {**opts, "keep_crops": True}
+
+    try:
+        if coarse_fps > 0:
+            items, out["adaptive"] = _analyze_adaptive(frames_dir, store, keys, names, times, enhance,
+                                                       enforce_detection, pool, opts, coarse_fps, min_confidence,
+                                                       crops)
+        elif journal is not None:
+            # los items quedan en el journal: journal.compact() arma el JSON final
+            out["resumed"] = _analyze_journaled(frames_dir, store, keys, names, enhance, enforce_detection,
+                                                pool, opts, journal, crops)
+            return out
+        else:
+            items = _analyze_keys(frames_dir, store, keys, enhance, enforce_detection, pool, opts, crops)
+    finally:
+        if crops is not None:
+            crops.close()
+    _attach_covers(items, load_manifest(frames_dir))
+    out["items"] = items
+    return out
+
+
 def analyze_frames_dir(
     frames_dir: str,
     enhance: bool = True,
     enforce_detection: bool = False,
+    pool: Optional[ProcessPoolExecutor] = None,
+    coarse_fps: float = 0.0,
+    min_confidence: float = 50.0,
+    journal: Optional[FaceJournal] = None,
+    crops: Optional[FaceCropWriter] = None,
+    **opts,
 ) -> Dict[str, Any]:
     """
-    Procesa TODOS los .jpg en frames_dir y devuelve una serie temporal:
+    Procesa TODOS los .jpg en frames_dir (o el frames.u8 empaquetado si existe)
+    y devuelve una serie temporal:
     items: [{t, frame, dominant_emotion, scores}] + errores por frame si aplica
+    pool (make_face_pool): reparte los frames en tandas de SHARD_FRAMES entre procesos.
+    coarse_fps > 0: modo adaptativo (grilla gruesa + refinamiento, ver _analyze_adaptive).
+    journal (FaceJournal): los items se escriben ahí a medida que salen y se retoma lo ya
+    hecho; el resultado no trae "items" (se arman con journal.compact). No aplica con coarse_fps.
+    crops (FaceCropWriter): guarda los recortes de cara alineados (48x48) + cajas, para
+    re-clasificar después sin detector (face_crops.py). Ver keep_crops en analyze_frames.
+    opts: se pasan a analyze_frames (server, batch_size, track, ...).
     """
     if not os.path.isdir(frames_dir):
         raise FileNotFoundError(f"No existe la carpeta: {frames_dir}")
 
+    if has_frame_store(frames_dir):
+        # frames.u8 memory-mapped: sin listar ni abrir un archivo por frame
+        store = FrameStore(frames_dir)
+        return _analyze_indexed(frames_dir, store, list(range(len(store))), list(store.names),
+                                [float(t) for t in store.t], enhance, enforce_detection, pool,
+                                coarse_fps, min_confidence, journal, crops, opts)
+
     frames = sorted([f for f in os.listdir(frames_dir) if f.lower().endswith(".jpg")])
     if not frames:
         return {
@@ -60,56 +728,98 @@ def analyze_frames_dir(
             "errors": ["No se encontraron .jpg en la carpeta"]
         }
 
-    items: List[Dict[str, Any]] = []
+    return _analyze_indexed(frames_dir, None, frames, frames, [_frame_time_from_name(f) for f in frames],
+                            enhance, enforce_detection, pool, coarse_fps, min_confidence, journal, crops, opts)
 
-    for fname in frames:
-        fpath = os.path.join(frames_dir, fname)
-        t = _frame_time_from_name(fname)  # preferido (porque ya lo tienes en el nombre)
-
-        try:
-            img = cv2.imread(fpath)
-            if img is None:
-                raise ValueError("Imagen no pudo cargarse (cv2.imread devolvió None)")
 
-            if enhance:
-                img = _enhance_clahe_bgr(img)
+def _iter_video_frames(video_path: str, target_fps: float, mode: str, dump_dir: Optional[str]):
+    if dump_dir:
+        os.makedirs(dump_dir, exist_ok=True)
+    for i, t, frame in iter_frames(video_path, target_fps=target_fps, mode=mode):
+        fname = frame_name(i, t)
+        if dump_dir:
+            # solo para depurar: el análisis usa el frame en memoria, no el JPEG
+            cv2.imwrite(os.path.join(dump_dir, fname), frame)
+        yield round(t, 2), fname, frame
 
-            r = DeepFace.analyze(
-                img_path=img,
-                actions=["emotion"],
-                enforce_detection=enforce_detection,
-            )
-            if isinstance(r, list):
-                r = r[0]
 
-            dom = r.get("dominant_emotion")
-            scores = _to_float_dict(r.get("emotion", {}))
+def analyze_video(
+    video_path: str,
+    target_fps: float = 2.0,
+    enhance: bool = True,
+    enforce_detection: bool = False,
+    mode: str = "grab",
+    dump_dir: Optional[str] = None,
+    journal: Optional[FaceJournal] = None,
+    crops: Optional[FaceCropWriter] = None,
+    **opts,
+) -> Dict[str, Any]:
+    """
+    Igual que analyze_frames_dir pero leyendo los frames directo del video (streaming),
+    sin encode/decode JPEG ni disco. dump_dir (opcional) guarda los JPEG para depurar.
+    journal: como en analyze_frames_dir (al retomar se decodifica igual, pero no se re-analiza).
+    crops: como en analyze_frames_dir.
+    opts: se pasan a analyze_frames (server, batch_size, track, ...).
+    """
+    if not os.path.isfile(video_path):
+        raise FileNotFoundError(f"No existe el video: {video_path}")
 
-            items.append({
-                "t": t,
-                "frame": fname,
-                "dominant_emotion": dom,
-                "scores": scores
-            })
+    frames = _iter_video_frames(video_path, target_fps, mode, dump_dir)
+    done = journal.done() if journal is not None else set()
+    if done:
+        frames = (f for f in frames if f[1] not in done)
+    if opts.get("prefetch"):
+        frames = Prefetcher(frames, depth=opts["prefetch"])  # decodificar en su propio hilo
+    if crops is not None:
+        opts = {**opts, "keep_crops": True}
 
-        except Exception as e:
-            # No se cae el pipeline: registra error y continúa
-            items.append({
-                "t": t,
-                "frame": fname,
-                "error": str(e)
-            })
+    try:
+        if journal is not None:
+            frames = iter(frames)  # un solo iterador para todas las tandas (el Prefetcher se cierra al soltarlo)
+            try:
+                while True:
+                    # analyze_frames da un item por frame: tanda vacía = fin del video
+                    part = analyze_frames(islice(frames, JOURNAL_CHUNK), enhance=enhance,
+                                          enforce_detection=enforce_detection, **opts)
+                    if not part:
+                        break
+                    if crops is not None:
+                        crops.take(part)
+                    journal.append(part)
+            finally:
+                journal.close()
+            return {"frames_dir": dump_dir, "video": video_path, "resumed": len(done)}
 
-    # ordenar por tiempo si existe; si t es None, queda al final por frame name
-    items.sort(key=lambda x: (x["t"] is None, x["t"] if x["t"] is not None else 0.0, x["frame"]))
+        items = analyze_frames(
+            frames,
+            enhance=enhance,
+            enforce_detection=enforce_detection,
+            **opts
+        )
+        if crops is not None:
+            crops.take(items)
+    finally:
+        if crops is not None:
+            crops.close()
 
     return {
-        "frames_dir": frames_dir,
-        "n_frames": len(frames),
+        "frames_dir": dump_dir,
+        "video": video_path,
+        "n_frames": len(items),
         "items": items
     }
 
 
+def analyze_video_task(**kwargs) -> Tuple[Dict[str, Any], Tuple[int, int]]:
+    """
+    analyze_video para un worker del pool (un video entero por tarea): retorna
+    (data, (hits, misses)) del cache del worker, como _analyze_shard.
+    """
+    data = analyze_video(**kwargs)
+    cache = kwargs.get("cache")
+    return data, ((cache.hits, cache.misses) if cache is not None else (0, 0))
+
+
 def save_json(data: Dict[str, Any], out_path: str) -> None:
     os.makedirs(os.path.dirname(out_path), exist_ok=True)
     with open(out_path, "w", encoding="utf-8") as f:
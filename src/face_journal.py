@@ -0,0 +1,141 @@
+import os
+import json
+import time
+from typing import Any, Dict, Iterable, Optional, Set
+
+
+class FaceJournal:
+    """
+    Journal JSONL de items por frame (<salida>.journal.jsonl), escrito a medida que salen:
+      línea 1 = {"journal": 1, "params": {...}}; luego un item por línea.
+    fsync cada fsync_every segundos (y en sync()), así un corte pierde como mucho eso.
+    done() da los frames ya terminados para retomar; compact() escribe el JSON final
+    leyendo el journal línea a línea (sin tener todos los items en memoria) y lo borra.
+    Si params cambió respecto del journal existente, se empieza de cero.
+    """
+
+    def __init__(self, path: str, params: Optional[Dict[str, Any]] = None, fsync_every: float = 5.0):
+        self.path = path
+        self.params = dict(params or {})
+        self.fsync_every = fsync_every
+        self._f = None
+        self._last_sync = 0.0
+
+    def __getstate__(self):
+        # se manda a workers (un video por tarea): el archivo se abre en el proceso
+        state = dict(self.__dict__)
+        state["_f"] = None
+        return state
+
+    def _header(self) -> Dict[str, Any]:
+        return {"journal": 1, "params": self.params}
+
+    def done(self) -> Set[str]:
+        """
+        Frames ya escritos. Una última línea cortada (crash a mitad de escritura)
+        se descarta truncando el archivo.
+        """
+        names: Set[str] = set()
+        if not os.path.isfile(self.path):
+            return names
+        good = 0
+        with open(self.path, "rb") as f:
+            for n, raw in enumerate(f):
+                try:
+                    obj = json.loads(raw.decode("utf-8"))
+                except ValueError:
+                    break
+                if not raw.endswith(b"\n"):
+                    break
+                if n == 0:
+                    if obj != self._header():
+                        break  # otro análisis (u otros parámetros): no sirve
+                else:
+                    names.add(obj["frame"])
+                good += len(raw)
+        if good == 0:
+            os.remove(self.path)
+            return set()
+        if good < os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(good)
+        return names
+
+    def _file(self):
+        if self._f is None:
+            parent = os.path.dirname(self.path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            new = not os.path.isfile(self.path)
+            self._f = open(self.path, "a", encoding="utf-8")
+            if new:
+                self._f.write(json.dumps(self._header(), ensure_ascii=False) + "\n")
+            self._last_sync = time.monotonic()
+        return self._f
+
+    def append(self, items: Iterable[Dict[str, Any]]) -> None:
+        f = self._file()
+        for it in items:
+            f.write(json.dumps(it, ensure_ascii=False) + "\n")
+        f.flush()
+        if time.monotonic() - self._last_sync >= self.fsync_every:
+            self.sync()
+
+    def sync(self) -> None:
+        if self._f is not None:
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            self._last_sync = time.monotonic()
+
+    def close(self) -> None:
+        if self._f is not None:
+            self.sync()
+            self._f.close()
+            self._f = None
+
+    def compact(self, out_path: str, data: Dict[str, Any]) -> Dict[str, int]:
+        """
+        Escribe out_path = data + "items" (del journal, en orden y sin repetidos),
+        de forma atómica, y borra el journal. Retorna conteos para el reporte.
+        """
+        self.close()
+        counts = {"items": 0, "errors": 0, "detect": 0, "track": 0, "low": 0, "full": 0}
+        seen: Set[str] = set()
+        tmp = out_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as out:
+            out.write("{\n")
+            for k, v in data.items():
+                if k != "items":
+                    out.write(f"  {json.dumps(k)}: {json.dumps(v, ensure_ascii=False)},\n")
+            out.write('  "items": [')
+            if os.path.isfile(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    next(f, None)  # cabecera
+                    for line in f:
+                        it = json.loads(line)
+                        if it["frame"] in seen:
+                            continue
+                        seen.add(it["frame"])
+                        out.write(("\n    " if not counts["items"] else ",\n    ") + json.dumps(it, ensure_ascii=False))
+                        counts["items"] += 1
+                        counts["errors"] += "error" in it
+                        if it.get("roi_source") in ("detect", "track"):
+                            counts[it["roi_source"]] += 1
+                        if it.get("tier") in ("low", "full"):
+                            counts[it["tier"]] += 1
+            out.write("\n  ]")
+            if "n_frames" not in data:
+                # streaming desde video: recién acá se sabe cuántos frames hubo
+                out.write(f',\n  "n_frames": {counts["items"]}')
+            out.write("\n}\n")
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, out_path)
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+        return counts
+
+
+def journal_path_for(out_path: str) -> str:
+    base, _ = os.path.splitext(out_path)
+    return f"{base}.journal.jsonl"
@@ -0,0 +1,179 @@
+from typing import Dict, Any, Optional, Tuple
+
+import cv2
+
+
+Box = Tuple[int, int, int, int]  # x, y, w, h en coordenadas del frame original
+
+
+class HaarFaceDetector:
+    """
+    Detector barato (Haar cascade de OpenCV) para ubicar la cara antes de DeepFace.
+    Detecta sobre una versión reducida (detect_width) y devuelve la caja más grande
+    en coordenadas del frame original, o None.
+    """
+
+    def __init__(self, detect_width: int = 320, min_size: int = 24):
+        path = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+        self.cascade = cv2.CascadeClassifier(path)
+        if self.cascade.empty():
+            raise RuntimeError(f"No se pudo cargar el cascade: {path}")
+        self.detect_width = detect_width
+        self.min_size = min_size
+
+    def detect(self, frame_bgr) -> Optional[Box]:
+        h, w = frame_bgr.shape[:2]
+        scale = min(1.0, self.detect_width / float(w))
+        small = frame_bgr if scale >= 1.0 else cv2.resize(
+            frame_bgr, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA
+        )
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        faces = self.cascade.detectMultiScale(
+            gray, scaleFactor=1.1, minNeighbors=5, minSize=(self.min_size, self.min_size)
+        )
+        if len(faces) == 0:
+            return None
+        x, y, fw, fh = max(faces, key=lambda b: b[2] * b[3])
+        return (int(x / scale), int(y / scale), int(fw / scale), int(fh / scale))
+
+
+class FaceTracker:
+    """
+    Detecta la cara solo en keyframes y la sigue entre medio con template matching:
+      - detecta (HaarFaceDetector) al inicio, cada keyframe_every frames,
+        o cuando la correlación del seguimiento cae bajo min_score
+      - si no, busca la plantilla del último keyframe en una ventana alrededor
+        de la última caja (search_pad: fracción del lado)
+    La plantilla se toma solo en keyframes para que la caja no derive.
+    """
+
+    def __init__(
+        self,
+        detector: Optional[HaarFaceDetector] = None,
+        keyframe_every: int = 15,
+        min_score: float = 0.6,
+        search_pad: float = 0.5,
+    ):
+        self.detector = detector or HaarFaceDetector()
+        self.keyframe_every = max(1, keyframe_every)
+        self.min_score = min_score
+        self.search_pad = search_pad
+        self.box: Optional[Box] = None
+        self.template = None
+        self.since_key = 0
+        self.n_detect = 0
+        self.n_track = 0
+
+    def _detect(self, frame_bgr) -> Optional[Box]:
+        self.n_detect += 1
+        self.since_key = 0
+        self.box = self.detector.detect(frame_bgr)
+        if self.box is None:
+            self.template = None
+        else:
+            x, y, w, h = self.box
+            self.template = cv2.cvtColor(frame_bgr[y:y + h, x:x + w], cv2.COLOR_BGR2GRAY)
+        return self.box
+
+    def _track(self, frame_bgr) -> Tuple[Optional[Box], float]:
+        x, y, w, h = self.box
+        fh, fw = frame_bgr.shape[:2]
+        px, py = int(w * self.search_pad), int(h * self.search_pad)
+        x0, y0 = max(0, x - px), max(0, y - py)
+        x1, y1 = min(fw, x + w + px), min(fh, y + h + py)
+        th, tw = self.template.shape[:2]
+        if (y1 - y0) < th or (x1 - x0) < tw:
+            return None, 0.0
+        window = cv2.cvtColor(frame_bgr[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+        res = cv2.matchTemplate(window, self.template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (mx, my) = cv2.minMaxLoc(res)
+        return (x0 + mx, y0 + my, tw, th), float(score)
+
+    def update(self, frame_bgr) -> Tuple[Optional[Box], str]:
+        """
+        Retorna (caja, origen) con origen "detect" o "track".
+        """
+        if self.template is not None and self.since_key < self.keyframe_every:
+            box, score = self._track(frame_bgr)
+            if box is not None and score >= self.min_score:
+                self.box = box
+                self.since_key += 1
+                self.n_track += 1
+                return box, "track"
+        return self._detect(frame_bgr), "detect"
+
+
+def square_roi(box: Box, pad: float, frame_w: int, frame_h: int) -> Box:
+    """
+    Expande la caja en `pad` (fracción del lado) y la vuelve cuadrada, recortada al frame.
+    """
+    x, y, w, h = box
+    cx, cy = x + w / 2.0, y + h / 2.0
+    side = int(round(max(w, h) * (1.0 + 2.0 * pad)))
+    side = min(side, frame_w, frame_h)
+    x0 = int(round(cx - side / 2.0))
+    y0 = int(round(cy - side / 2.0))
+    x0 = max(0, min(x0, frame_w - side))
+    y0 = max(0, min(y0, frame_h - side))
+    return (x0, y0, side, side)
+
+
+def downscale(frame_bgr, max_side: Optional[int]):
+    """
+    Reduce para que el lado mayor sea <= max_side. Retorna (frame, scale).
+    """
+    h, w = frame_bgr.shape[:2]
+    if not max_side or max(h, w) <= max_side:
+        return frame_bgr, 1.0
+    scale = max_side / float(max(h, w))
+    out = cv2.resize(frame_bgr, (int(round(w * scale)), int(round(h * scale))), interpolation=cv2.INTER_AREA)
+    return out, scale
+
+
+def reduce_frame(
+    frame_bgr,
+    max_side: Optional[int] = None,
+    detector: Optional[HaarFaceDetector] = None,
+    pad: float = 0.25,
+    last_roi: Optional[Box] = None,
+    square: bool = False,
+) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Aplica el modo de salida reducido:
+      - con detector: recorta una ROI cuadrada (con padding) alrededor de la cara;
+        si no detecta, reutiliza last_roi (la cara casi no se mueve) o deja el frame completo
+      - max_side: reescala el resultado para que su lado mayor no pase de max_side
+        (con ROI, la ROI se lleva exactamente a max_side x max_side)
+      - square (requiere max_side): sin ROI, el frame completo va centrado en un cuadrado con
+        relleno negro, así TODAS las salidas miden max_side x max_side (frames.u8 tiene forma fija)
+    Retorna (frame, geom) con geom = {orig_size, roi, scale}: un pixel (u, v) de la salida
+    corresponde a (roi_x + u / scale, roi_y + v / scale) en el frame original.
+    Con el relleno de square, geom trae además offset = [ox, oy] y el pixel corresponde a
+    (ox + u / scale, oy + v / scale).
+    """
+    if square and not max_side:
+        raise ValueError("square=True necesita max_side (tamaño fijo de salida)")
+    h, w = frame_bgr.shape[:2]
+    roi = None
+    if detector is not None:
+        box = detector.detect(frame_bgr)
+        roi = square_roi(box, pad, w, h) if box is not None else last_roi
+
+    if roi is not None and max_side:
+        # ROI cuadrada a tamaño fijo: todas las salidas quedan con la misma forma
+        x, y, side, _ = roi
+        out = cv2.resize(frame_bgr[y:y + side, x:x + side], (max_side, max_side), interpolation=cv2.INTER_AREA)
+        scale = max_side / float(side)
+    elif roi is not None:
+        x, y, side, _ = roi
+        out, scale = frame_bgr[y:y + side, x:x + side], 1.0
+    elif square:
+        side = max(w, h)
+        px, py = (side - w) // 2, (side - h) // 2
+        canvas = cv2.copyMakeBorder(frame_bgr, py, side - h - py, px, side - w - px, cv2.BORDER_CONSTANT, value=0)
+        out = cv2.resize(canvas, (max_side, max_side), interpolation=cv2.INTER_AREA)
+        scale = max_side / float(side)
+        return out, {"orig_size": [w, h], "roi": None, "scale": scale, "offset": [-px, -py]}
+    else:
+        out, scale = downscale(frame_bgr, max_side)
+    return out, {"orig_size": [w, h], "roi": list(roi) if roi is not None else None, "scale": scale}
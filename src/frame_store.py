@@ -0,0 +1,198 @@
+import os
+import bisect
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from video_utils import read_json, write_json
+
+
+DATA_NAME = "frames.u8"
+INDEX_NAME = "frames_index.json"
+
+
+def has_packed(out_dir: str, data_name: str, index_name: str) -> bool:
+    return os.path.exists(os.path.join(out_dir, index_name)) and \
+        os.path.exists(os.path.join(out_dir, data_name))
+
+
+def has_frame_store(frames_dir: str) -> bool:
+    return has_packed(frames_dir, DATA_NAME, INDEX_NAME)
+
+
+class PackedWriter:
+    """
+    Arreglo empaquetado: items uint8 de forma fija en un solo archivo (N, *shape) + índice
+    JSON con n, shape, una lista por columna (un valor por item) y campos extra.
+    Base de FrameStoreWriter y de face_crops.FaceCropWriter. El archivo se abre en open(),
+    no al construir: el objeto se puede mandar a un worker y abrirse allá.
+    """
+
+    def __init__(self, out_dir: str, data_name: str, index_name: str, columns: Iterable[str],
+                 shape: Optional[Tuple[int, ...]] = None, extra: Optional[Dict[str, Any]] = None):
+        self.out_dir = out_dir
+        self.data_name = data_name
+        self.index_name = index_name
+        self.shape: Optional[Tuple[int, ...]] = tuple(shape) if shape else None
+        self.cols: Dict[str, List[Any]] = {c: [] for c in columns}
+        self.extra = dict(extra or {})
+        self.n = 0
+        self._f = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_f"] = None
+        return state
+
+    def read_index(self) -> Optional[Dict[str, Any]]:
+        if not has_packed(self.out_dir, self.data_name, self.index_name):
+            return None
+        return read_json(os.path.join(self.out_dir, self.index_name))
+
+    def open(self, resume_n: int = 0) -> None:
+        """
+        resume_n > 0: reabre un arreglo parcial y conserva sus primeros resume_n items
+        (lo que confirmó el último checkpoint); el resto se trunca.
+        """
+        os.makedirs(self.out_dir, exist_ok=True)
+        data_path = os.path.join(self.out_dir, self.data_name)
+        idx = self.read_index() if resume_n > 0 else None
+        if idx and idx.get("shape") and int(idx.get("n", 0)) >= resume_n:
+            self.shape = tuple(idx["shape"])
+            self.cols = {c: list(idx[c][:resume_n]) for c in self.cols}
+            self.n = resume_n
+            self._f = open(data_path, "r+b")
+            self._f.truncate(resume_n * int(np.prod(self.shape)))
+            self._f.seek(0, os.SEEK_END)
+            return
+        self.cols = {c: [] for c in self.cols}
+        self.n = 0
+        self._f = open(data_path, "wb")
+
+    def write(self, arr, **values) -> None:
+        # values: un valor por columna
+        if self.shape is None:
+            self.shape = tuple(arr.shape)
+        self._f.write(np.ascontiguousarray(arr, dtype=np.uint8).tobytes())
+        for c, v in values.items():
+            self.cols[c].append(v)
+        self.n += 1
+
+    def __len__(self) -> int:
+        return self.n
+
+    def flush(self) -> None:
+        """
+        Checkpoint: datos a disco y luego el índice, así el índice nunca apunta a bytes sin escribir.
+        """
+        if self._f is None:
+            return
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        write_json({
+            "dtype": "uint8",
+            "shape": list(self.shape) if self.shape else None,
+            "n": self.n,
+            **self.cols,
+            **self.extra
+        }, os.path.join(self.out_dir, self.index_name), indent=None)
+
+    def close(self) -> None:
+        if self._f is not None:
+            self.flush()
+            self._f.close()
+            self._f = None
+
+
+class PackedArray:
+    """
+    Lector de PackedWriter: np.memmap de solo lectura (n, *shape) + el índice (idx).
+    empty_shape: forma de cada item si el arreglo está vacío y el índice no la tiene.
+    """
+
+    def __init__(self, out_dir: str, data_name: str, index_name: str, empty_shape: Tuple[int, ...] = ()):
+        self.idx: Dict[str, Any] = read_json(os.path.join(out_dir, index_name))
+        n = int(self.idx.get("n", 0))
+        shape = self.idx.get("shape")
+        if n == 0 or not shape:
+            self.data = np.zeros((0, *(shape or empty_shape)), dtype=np.uint8)
+        else:
+            self.data = np.memmap(
+                os.path.join(out_dir, data_name),
+                dtype=np.uint8,
+                mode="r",
+                shape=(n, *shape)
+            )
+
+    def column(self, name: str) -> List[Any]:
+        return list(self.idx.get(name, []))[:len(self.data)]
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, k):
+        return self.data[k]
+
+
+class FrameStoreWriter(PackedWriter):
+    """
+    Contenedor empaquetado: todos los frames de un video en un solo archivo uint8
+    (N, H, W, 3) + índice JSON con (t, índice original, nombre) por frame.
+    Evita miles de JPEG sueltos y el encode/decode con pérdida.
+    """
+
+    def __init__(self, out_dir: str, resume_n: int = 0):
+        """
+        resume_n > 0: reabre un store parcial y conserva sus primeros resume_n frames
+        (lo que confirmó el último checkpoint); el resto se trunca.
+        """
+        super().__init__(out_dir, DATA_NAME, INDEX_NAME, ("t", "i", "frames"))
+        self.open(resume_n)
+
+    def append(self, i: int, t: float, frame_bgr, name: str) -> None:
+        if self.shape is not None and tuple(frame_bgr.shape) != self.shape:
+            # forma fija: si el video cambia de resolución, se reescala al primer frame
+            h, w = self.shape[:2]
+            frame_bgr = cv2.resize(frame_bgr, (w, h), interpolation=cv2.INTER_AREA)
+        self.write(frame_bgr, t=round(float(t), 2), i=int(i), frames=name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FrameStore(PackedArray):
+    """
+    Lector: np.memmap sobre frames.u8, acceso aleatorio por posición o por tiempo.
+    """
+
+    def __init__(self, frames_dir: str):
+        super().__init__(frames_dir, DATA_NAME, INDEX_NAME, empty_shape=(0, 0, 3))
+        self.frames_dir = frames_dir
+        self.frames = self.data
+        self.t: List[float] = [float(x) for x in self.column("t")]
+        self.i: List[int] = [int(x) for x in self.column("i")]
+        self.names: List[str] = self.column("frames")
+
+    def index_at(self, t: float) -> int:
+        """
+        Posición del frame más cercano a t (los t están ordenados).
+        """
+        if not self.t:
+            raise IndexError("FrameStore vacío")
+        k = bisect.bisect_left(self.t, t)
+        if k <= 0:
+            return 0
+        if k >= len(self.t):
+            return len(self.t) - 1
+        return k if (self.t[k] - t) < (t - self.t[k - 1]) else k - 1
+
+    def at_time(self, t: float):
+        return self.frames[self.index_at(t)]
+
+    def entries(self) -> Iterator[Dict[str, Any]]:
+        for k in range(len(self.t)):
+            yield {"t": self.t[k], "i": self.i[k], "frame": self.names[k]}
@@ -0,0 +1,369 @@
+import os
+import json
+import time
+import queue
+import base64
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from emotion_backend import backend_fingerprint
+from logger_utils import get_logger
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_URL = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+DEFAULT_TEXT_MODEL = "j-hartmann/emotion-english-distilroberta-base"
+MODELS = ("face", "text", "whisper")
+
+
+# ---------------------------------------------------------------------------
+# protocolo: JSON sobre HTTP local; las imágenes viajan crudas en base64 (uint8)
+# ---------------------------------------------------------------------------
+
+def encode_image(img) -> Dict[str, Any]:
+    arr = np.ascontiguousarray(img, dtype=np.uint8)
+    return {"shape": list(arr.shape), "data": base64.b64encode(arr.tobytes()).decode("ascii")}
+
+
+def decode_image(d: Dict[str, Any]):
+    buf = base64.b64decode(d["data"])
+    return np.frombuffer(buf, dtype=np.uint8).reshape(d["shape"])
+
+
+class DynamicBatcher:
+    """
+    Junta pedidos concurrentes en lotes: toma lo que llegue durante max_wait_ms
+    (o hasta max_batch) y llama fn(lista) una sola vez desde su propio hilo.
+    fn devuelve un resultado por elemento; cada pedido lo recibe por un Future.
+    Al correr siempre en el mismo hilo, el modelo nunca se usa en paralelo.
+    """
+
+    def __init__(self, fn: Callable[[List[Any]], List[Any]], max_batch: int = 16,
+                 max_wait_ms: float = 10.0, name: str = "batcher"):
+        self.fn = fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.batches = 0
+        self.items = 0
+        self._q: "queue.Queue[Any]" = queue.Queue()
+        self._t = threading.Thread(target=self._run, name=name, daemon=True)
+        self._t.start()
+
+    def submit(self, x: Any) -> Future:
+        fut: Future = Future()
+        self._q.put((x, fut))
+        return fut
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._q.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._q.get(timeout=remaining) if remaining > 0 else self._q.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                outs = self.fn([x for x, _ in batch])
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += len(batch)
+            for (_, fut), out in zip(batch, outs):
+                fut.set_result(out)
+
+
+# ---------------------------------------------------------------------------
+# servidor
+# ---------------------------------------------------------------------------
+
+class ModelHost:
+    """
+    Mantiene los modelos cargados (una vez, al primer uso o con preload) y un
+    DynamicBatcher por modelo/configuración. Los imports pesados (TF, torch,
+    CTranslate2) se hacen acá adentro, no al importar el módulo.
+    """
+
+    def __init__(
+        self,
+        whisper_model: str = "small",
+        device: str = "cpu",
+        compute_type: str = "int8",
+        cpu_threads: int = 0,
+        cache_dir: Optional[str] = None,
+        max_batch: int = 16,
+        max_wait_ms: float = 10.0,
+        face_backend: str = "deepface",
+    ):
+        self.whisper = (whisper_model, device, compute_type, cpu_threads, cache_dir)
+        self.face_backend = face_backend
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self._batchers: Dict[Any, DynamicBatcher] = {}
+        self._lock = threading.Lock()
+
+    def _batcher(self, key, factory: Callable[[], Callable], max_batch: Optional[int] = None) -> DynamicBatcher:
+        with self._lock:
+            b = self._batchers.get(key)
+            if b is None:
+                b = DynamicBatcher(factory(), max_batch=max_batch or self.max_batch,
+                                   max_wait_ms=self.max_wait_ms, name=str(key))
+                self._batchers[key] = b
+            return b
+
+    # -- modelos --
+
+    def _face_fn(self, enforce_detection: bool, crops: bool):
+        from face_emotion_day2 import analyze_crops_batched, analyze_images_batched  # DeepFace/TF una sola vez
+
+        backend = self.face_backend
+        if crops:
+            # recortes ya ubicados por el cliente (tracking)
+            return lambda imgs: analyze_crops_batched(imgs, backend)
+        # detección por imagen + una sola pasada del modelo de emociones por lote
+        return lambda imgs: analyze_images_batched(imgs, enforce_detection, backend)
+
+    @staticmethod
+    def _text_fn(model_name: str):
+        from text_emotion_day2 import build_text_classifier
+
+        classifier = build_text_classifier(model_name)
+
+        def run(texts):
+            return classifier(texts, batch_size=len(texts))
+        return run
+
+    def _whisper_fn(self):
+        import transcribe
+
+        transcribe._init_worker(*self.whisper)
+
+        def run(reqs):
+            out = []
+            for r in reqs:
+                try:
+                    out.append(transcribe._transcribe_file(**r))
+                except Exception as e:
+                    out.append({"error": str(e)})
+            return out
+        return run
+
+    # -- API --
+
+    def analyze_faces(self, imgs: List[Any], enforce_detection: bool = False,
+                      crops: bool = False) -> List[Dict[str, Any]]:
+        key = ("face", "crops") if crops else ("face", enforce_detection)
+        b = self._batcher(key, lambda: self._face_fn(enforce_detection, crops))
+        return [f.result() for f in [b.submit(img) for img in imgs]]
+
+    def classify_texts(self, texts: List[str], model: str = DEFAULT_TEXT_MODEL) -> List[Any]:
+        b = self._batcher(("text", model), lambda: self._text_fn(model))
+        return [f.result() for f in [b.submit(t) for t in texts]]
+
+    def transcribe(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        # Whisper ya paraleliza por dentro (y batch_size usa su pipeline por lotes): de a uno
+        b = self._batcher(("whisper",), self._whisper_fn, max_batch=1)
+        return b.submit(req).result()
+
+    def preload(self, models: List[str], text_model: str = DEFAULT_TEXT_MODEL) -> None:
+        if "face" in models:
+            self.analyze_faces([np.zeros((48, 48, 3), dtype=np.uint8)])  # warm-up: carga el modelo
+        if "text" in models:
+            self.classify_texts(["warm up"], model=text_model)
+        if "whisper" in models:
+            import transcribe
+
+            self._batcher(("whisper",), self._whisper_fn, max_batch=1)
+            transcribe._worker_model.model  # cualquier atributo fuerza la carga del _LazyModel
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "/".join(str(k) for k in key): {"batches": b.batches, "items": b.items}
+                for key, b in self._batchers.items()
+            }
+
+
+def _make_handler(host: ModelHost, log):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code: int, obj: Any) -> None:
+            body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, {"ok": True, "face_backend": backend_fingerprint(host.face_backend),
+                                 "batchers": host.stats()})
+            else:
+                self._send(404, {"error": f"Ruta desconocida: {self.path}"})
+
+        def do_POST(self):
+            try:
+                n = int(self.headers.get("Content-Length") or 0)
+                req = json.loads(self.rfile.read(n).decode("utf-8") or "{}")
+                if self.path == "/face":
+                    imgs = [decode_image(d) for d in req.get("images", [])]
+                    res = {"results": host.analyze_faces(imgs, bool(req.get("enforce_detection", False)),
+                                                         crops=bool(req.get("crops", False)))}
+                elif self.path == "/text":
+                    res = {"results": host.classify_texts(req.get("texts", []), req.get("model") or DEFAULT_TEXT_MODEL)}
+                elif self.path == "/transcribe":
+                    res = host.transcribe(req)
+                    if "error" in res:
+                        self._send(500, res)
+                        return
+                else:
+                    self._send(404, {"error": f"Ruta desconocida: {self.path}"})
+                    return
+            except Exception as e:
+                log.info(f"Error en {self.path}: {e}")
+                self._send(500, {"error": str(e)})
+                return
+            self._send(200, res)
+
+        def log_message(self, fmt, *args):
+            pass  # sin una línea por request
+
+    return Handler
+
+
+# ---------------------------------------------------------------------------
+# cliente
+# ---------------------------------------------------------------------------
+
+class ModelClient:
+    """
+    Cliente mínimo (urllib) del servidor de modelos. Las rutas de archivos que se
+    envían deben ser visibles para el servidor (misma máquina): se mandan absolutas.
+    """
+
+    def __init__(self, url: str = DEFAULT_URL, timeout: float = 3600.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, path: str, payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        data = None if payload is None else json.dumps(payload).encode("utf-8")
+        req = urllib.request.Request(self.url + path, data=data, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as r:
+                return json.loads(r.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            try:
+                msg = json.loads(e.read().decode("utf-8")).get("error")
+            except Exception:
+                msg = str(e)
+            raise RuntimeError(f"Servidor de modelos ({path}): {msg}")
+        except urllib.error.URLError as e:
+            raise RuntimeError(f"No se pudo conectar al servidor de modelos en {self.url}: {e.reason}")
+
+    def health(self) -> Dict[str, Any]:
+        return self._request("/health")
+
+    def face_backend(self) -> Optional[str]:
+        # identidad del modelo de caras del servidor (su --face-backend) para claves de cache;
+        # None si no responde
+        try:
+            return self.health().get("face_backend")
+        except RuntimeError:
+            return None
+
+    def analyze_faces(self, imgs: List[Any], enforce_detection: bool = False,
+                      crops: bool = False) -> List[Dict[str, Any]]:
+        # crops=True: las imágenes ya son recortes de cara (el servidor no detecta)
+        payload = {"images": [encode_image(img) for img in imgs], "enforce_detection": enforce_detection,
+                   "crops": crops}
+        return self._request("/face", payload)["results"]
+
+    def classify_texts(self, texts: List[str], model: str = DEFAULT_TEXT_MODEL) -> List[Any]:
+        return self._request("/text", {"texts": list(texts), "model": model})["results"]
+
+    def transcribe(self, audio: str, out_json: str, language: str = "es",
+                   batch_size: int = 0, jsonl: bool = False) -> Dict[str, Any]:
+        return self._request("/transcribe", {
+            "apath": os.path.abspath(audio),
+            "out_json": os.path.abspath(out_json),
+            "language": language,
+            "batch_size": batch_size,
+            "jsonl": jsonl,
+        })
+
+
+class RemoteTextClassifier:
+    """
+    Se usa igual que el pipeline de HF: classifier(texto)[0] -> [{label, score}, ...].
+    """
+
+    def __init__(self, client: ModelClient, model_name: str = DEFAULT_TEXT_MODEL):
+        self.client = client
+        self.model_name = model_name
+
+    def __call__(self, texts, **_kwargs):
+        if isinstance(texts, str):
+            return self.client.classify_texts([texts], model=self.model_name)
+        return self.client.classify_texts(texts, model=self.model_name)
+
+
+def main():
+    log = get_logger("model_server")
+
+    ap = argparse.ArgumentParser(description="Servidor local que mantiene cargados Whisper, DeepFace y el clasificador de texto")
+    ap.add_argument("--host", default=DEFAULT_HOST)
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT)
+    ap.add_argument("--whisper-model", default="small", help="Modelo whisper (tiny/base/small/medium/large-v3)")
+    ap.add_argument("--device", default="cpu", help="cpu o cuda")
+    ap.add_argument("--compute-type", default="int8", help="int8 / float16 / float32")
+    ap.add_argument("--cpu-threads", type=int, default=0, help="Hilos de CTranslate2 (0 = todos)")
+    ap.add_argument("--cache-dir", default=None, help="Cache de transcripciones (opcional)")
+    ap.add_argument("--text-model", default=DEFAULT_TEXT_MODEL, help="Modelo HF a precargar con --preload text")
+    ap.add_argument("--preload", nargs="*", choices=MODELS, default=[],
+                    help="Modelos a cargar al arrancar (si no, se cargan con el primer pedido)")
+    ap.add_argument("--face-backend", default="deepface",
+                    help="Clasificador de emociones: deepface o ruta a un .onnx (src/export_emotion_onnx.py)")
+    ap.add_argument("--max-batch", type=int, default=16, help="Tamaño máximo de lote dinámico")
+    ap.add_argument("--max-wait-ms", type=float, default=10.0, help="Espera máxima para juntar un lote")
+    args = ap.parse_args()
+
+    host = ModelHost(
+        whisper_model=args.whisper_model,
+        device=args.device,
+        compute_type=args.compute_type,
+        cpu_threads=args.cpu_threads,
+        cache_dir=args.cache_dir,
+        max_batch=args.max_batch,
+        max_wait_ms=args.max_wait_ms,
+        face_backend=args.face_backend,
+    )
+    if args.preload:
+        t0 = time.perf_counter()
+        host.preload(args.preload, text_model=args.text_model)
+        log.info(f"Modelos precargados: {', '.join(args.preload)} ({time.perf_counter() - t0:.1f}s)")
+
+    server = ThreadingHTTPServer((args.host, args.port), _make_handler(host, log))
+    log.info(f"Sirviendo en http://{args.host}:{args.port} (Ctrl+C para salir)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
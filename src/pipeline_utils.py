@@ -0,0 +1,209 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Optional
+
+
+_END = object()
+
+
+class _Error:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+class Timed:
+    """
+    Envoltorio síncrono con la misma interfaz de métricas que Prefetcher (busy, count).
+    """
+
+    def __init__(self, source: Iterable[Any]):
+        self.busy = 0.0
+        self.count = 0
+        self._it = iter(source)
+
+    def __iter__(self):
+        while True:
+            t0 = time.perf_counter()
+            try:
+                x = next(self._it)
+            except StopIteration:
+                return
+            self.busy += time.perf_counter() - t0
+            self.count += 1
+            yield x
+
+    def close(self) -> None:
+        close = getattr(self._it, "close", None)
+        if close is not None:
+            close()
+
+
+class Prefetcher:
+    """
+    Itera `source` en un hilo aparte y deja los resultados en una cola acotada (depth),
+    así el productor (ej: decodificar video) trabaja mientras el consumidor procesa.
+    OpenCV libera el GIL, por eso hilos alcanzan.
+      - busy: segundos que el hilo pasó produciendo (sin contar esperas de cola llena)
+      - count: elementos producidos
+    Las excepciones del productor se relanzan en el consumidor.
+    """
+
+    def __init__(self, source: Iterable[Any], depth: int = 8):
+        self.q: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, depth))
+        self.busy = 0.0
+        self.count = 0
+        self._stop = threading.Event()
+        self._it = iter(source)
+        self._t = threading.Thread(target=self._run, daemon=True)
+        self._t.start()
+
+    def _put(self, x: Any) -> None:
+        while not self._stop.is_set():
+            try:
+                self.q.put(x, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _run(self) -> None:
+        try:
+            while not self._stop.is_set():
+                t0 = time.perf_counter()
+                try:
+                    x = next(self._it)
+                except StopIteration:
+                    break
+                self.busy += time.perf_counter() - t0
+                self.count += 1
+                self._put(x)
+        except BaseException as e:
+            self._put(_Error(e))
+        finally:
+            close = getattr(self._it, "close", None)
+            if close is not None:
+                close()
+            self._put(_END)
+
+    def __iter__(self):
+        try:
+            while True:
+                x = self.q.get()
+                if x is _END:
+                    return
+                if isinstance(x, _Error):
+                    raise x.exc
+                yield x
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        self._stop.set()
+        self._t.join()
+
+
+class WriterPool:
+    """
+    N hilos que drenan una cola acotada llamando fn(*args) (ej: cv2.imwrite).
+    join() espera a que se vacíe la cola (útil antes de un checkpoint);
+    close() termina los hilos. El primer error de un hilo se relanza al llamar submit/join/close.
+    """
+
+    def __init__(self, fn: Callable[..., Any], workers: int = 2, depth: int = 16):
+        self.fn = fn
+        self.q: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, depth))
+        self.busy = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+        self._error: Optional[BaseException] = None
+        self._threads = [threading.Thread(target=self._run, daemon=True) for _ in range(max(1, workers))]
+        for t in self._threads:
+            t.start()
+
+    def _run(self) -> None:
+        while True:
+            args = self.q.get()
+            if args is _END:
+                self.q.task_done()
+                return
+            t0 = time.perf_counter()
+            try:
+                if self._error is None:
+                    self.fn(*args)
+            except BaseException as e:
+                with self._lock:
+                    if self._error is None:
+                        self._error = e
+            finally:
+                with self._lock:
+                    self.busy += time.perf_counter() - t0
+                    self.count += 1
+                self.q.task_done()
+
+    def _check(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def submit(self, *args: Any) -> None:
+        self._check()
+        self.q.put(args)
+
+    def join(self) -> None:
+        self.q.join()
+        self._check()
+
+    def close(self) -> None:
+        for _ in self._threads:
+            self.q.put(_END)
+        for t in self._threads:
+            t.join()
+        self._check()
+
+
+class OrderedMap:
+    """
+    Aplica fn a cada elemento de `source` con N hilos y entrega los resultados EN ORDEN,
+    con a lo sumo `depth` elementos en vuelo: mientras el consumidor procesa uno, los hilos
+    ya van preparando los siguientes (ej: cv2.imread + CLAHE, que liberan el GIL).
+      - busy: segundos sumados de fn en todos los hilos
+      - count: elementos procesados
+    Las excepciones de fn se relanzan en el consumidor, en la posición del elemento.
+    """
+
+    def __init__(self, fn: Callable[[Any], Any], source: Iterable[Any], workers: int = 4, depth: int = 16):
+        self.fn = fn
+        self.busy = 0.0
+        self.count = 0
+        self.depth = max(1, depth)
+        self._source = source
+        self._lock = threading.Lock()
+        self._ex = ThreadPoolExecutor(max_workers=max(1, workers))
+
+    def _call(self, x: Any) -> Any:
+        t0 = time.perf_counter()
+        try:
+            return self.fn(x)
+        finally:
+            with self._lock:
+                self.busy += time.perf_counter() - t0
+                self.count += 1
+
+    def __iter__(self):
+        pending: "deque[Any]" = deque()
+        try:
+            for x in self._source:
+                pending.append(self._ex.submit(self._call, x))
+                if len(pending) >= self.depth:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for fut in pending:
+                fut.cancel()
+            self._ex.shutdown(wait=True)
+
+
+def rate(n: int, seconds: float) -> float:
+    return n / seconds if seconds > 0 else 0.0
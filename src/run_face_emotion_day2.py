@@ -1,8 +1,16 @@
 import os
 import argparse
+from concurrent.futures import as_completed
+from pathlib import Path
+from typing import Any, Dict, Optional
 
-from face_emotion_day2 import analyze_frames_dir
-from video_utils import list_subdirs, write_json
+from face_emotion_day2 import analyze_frames_dir, analyze_video, analyze_video_task, make_face_pool
+from emotion_backend import backend_fingerprint
+from face_cache import DEFAULT_CACHE_DB, FaceResultCache, face_cache_settings
+from face_crops import DEFAULT_CROPS_ROOT, FaceCropWriter
+from face_journal import FaceJournal, journal_path_for
+from model_server import DEFAULT_URL, ModelClient
+from video_utils import list_subdirs, sort_longest_first, write_json
 from logger_utils import get_logger
 
 
@@ -31,12 +39,122 @@ def main():
         action="store_true",
         help="Si se activa, DeepFace fallará cuando no detecte rostro (NO recomendado)"
     )
+    ap.add_argument(
+        "--from-videos",
+        action="store_true",
+        help="Streaming: lee frames directo de los .mp4 (sin JPEG intermedios)"
+    )
+    ap.add_argument("--videos-dir", default="data/raw_videos", help="Carpeta con videos .mp4 (modo --from-videos)")
+    ap.add_argument("--target-fps", type=float, default=2.0, help="Frames por segundo a analizar (modo --from-videos)")
+    ap.add_argument(
+        "--dump-frames",
+        action="store_true",
+        help="Con --from-videos, guarda además los JPEG en frames-root/<video> (solo para depurar)"
+    )
+    ap.add_argument(
+        "--server",
+        nargs="?",
+        const=DEFAULT_URL,
+        default=None,
+        help=f"Usa el servidor de modelos (python src/model_server.py) en vez de cargar DeepFace (default {DEFAULT_URL})"
+    )
+    ap.add_argument(
+        "--batch-size",
+        type=int,
+        default=0,
+        help="Detecta por frame y clasifica los recortes de cara en lotes de N (una pasada del modelo). 0 = frame a frame"
+    )
+    ap.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Procesos en paralelo, cada uno con su DeepFace cargado (reparte frames; con --from-videos, videos enteros)"
+    )
+    ap.add_argument("--tf-threads", type=int, default=0, help="Hilos de TensorFlow por worker (0 = núcleos / workers)")
+    ap.add_argument(
+        "--track",
+        action="store_true",
+        help="Detecta la cara solo en keyframes y la sigue entre medio (template matching); clasifica solo el recorte"
+    )
+    ap.add_argument("--keyframe-every", type=int, default=15, help="Con --track, re-detecta cada N frames como máximo")
+    ap.add_argument(
+        "--prefetch",
+        type=int,
+        default=0,
+        help="Profundidad de la cola de prefetch: lee + CLAHE hasta N frames por delante del modelo (0 = desactivado)"
+    )
+    ap.add_argument("--prefetch-workers", type=int, default=4, help="Hilos de lectura/CLAHE para --prefetch")
+    ap.add_argument(
+        "--backend",
+        default="deepface",
+        help="Clasificador de emociones: deepface (TF) o ruta a un .onnx de src/export_emotion_onnx.py (CPU, int8 opcional)"
+    )
+    ap.add_argument(
+        "--cascade-margin",
+        type=float,
+        default=0.0,
+        help="Cascada: analiza primero el frame reducido sin CLAHE y repite a resolución completa con CLAHE "
+             "solo si la diferencia entre las 2 emociones principales es menor a este valor (puntos %%). 0 = desactivada"
+    )
+    ap.add_argument("--cascade-scale", type=float, default=0.5, help="Escala del tier reducido de --cascade-margin")
+    ap.add_argument("--cache-db", default=DEFAULT_CACHE_DB, help="Cache de resultados por frame (SQLite)")
+    ap.add_argument("--no-cache", action="store_true", help="No leer ni escribir el cache de resultados")
+    ap.add_argument("--cache-max-mb", type=float, default=200.0, help="Tamaño máximo del cache (MB, evicción LRU)")
+    ap.add_argument(
+        "--adaptive",
+        type=float,
+        default=0.0,
+        metavar="FPS",
+        help="Muestreo adaptativo: analiza una grilla gruesa a FPS (ej. 0.5) y refina solo donde cambia "
+             "la emoción o baja la confianza; el resto se interpola (0 = analizar todos los frames)"
+    )
+    ap.add_argument("--min-confidence", type=float, default=50.0,
+                    help="Con --adaptive, puntaje máximo (%%) bajo el cual se refina el intervalo")
+    ap.add_argument(
+        "--no-journal",
+        action="store_true",
+        help="No escribir <salida>.journal.jsonl a medida que avanza (sin él, un corte pierde todo el video)"
+    )
+    ap.add_argument("--fsync-every", type=float, default=5.0, help="Segundos entre fsync del journal")
+    ap.add_argument(
+        "--save-crops",
+        nargs="?",
+        const=DEFAULT_CROPS_ROOT,
+        default=None,
+        metavar="DIR",
+        help=f"Guarda los recortes de cara alineados (48x48) + cajas por video en DIR/<video> "
+             f"(default {DEFAULT_CROPS_ROOT}); se re-clasifican con src/face_crops.py sin detector"
+    )
     args = ap.parse_args()
 
-    frames_root = args.frames_root
-    out_dir = args.out_dir
+    if args.adaptive > 0 and args.from_videos:
+        raise SystemExit("--adaptive necesita frames extraídos (acceso por índice): no se combina con --from-videos")
+    if args.save_crops and args.server:
+        raise SystemExit("--save-crops necesita el análisis local: no se combina con --server")
+
     enhance = not args.no_enhance
     enforce_detection = args.enforce_detection
+    args.cache = None if args.no_cache else FaceResultCache(
+        args.cache_db,
+        settings=face_cache_settings(),
+        max_bytes=int(args.cache_max_mb * 1024 * 1024)
+    )
+    try:
+        if args.from_videos:
+            _run_from_videos(args, log, enhance, enforce_detection)
+        else:
+            _run_frames_root(args, log, enhance, enforce_detection)
+    finally:
+        if args.cache is not None:
+            ev = args.cache.evict()
+            log.info(f"Cache: hits={args.cache.hits} | misses={args.cache.misses} | "
+                     f"evictadas={ev['removed']} | entradas={ev['entries']} | tamaño={ev['bytes'] / 1e6:.1f} MB")
+            args.cache.close()
+
+
+def _run_frames_root(args, log, enhance: bool, enforce_detection: bool) -> None:
+    frames_root = args.frames_root
+    out_dir = args.out_dir
 
     if not os.path.isdir(frames_root):
         raise SystemExit(f"No existe frames-root: {frames_root}")
@@ -51,27 +169,171 @@ def main():
 
     os.makedirs(out_dir, exist_ok=True)
 
-    for folder in targets:
-        frames_dir = os.path.join(frames_root, folder)
-        if not os.path.isdir(frames_dir):
-            log.info(f"Saltando (no existe carpeta): {frames_dir}")
-            continue
+    # un solo pool para todas las carpetas: los modelos se cargan una vez por worker
+    pool = make_face_pool(args.workers, args.tf_threads, args.backend) if args.workers > 1 and not args.server else None
+    try:
+        for folder in targets:
+            _run_folder(args, log, frames_root, folder, enhance, enforce_detection, pool)
+    finally:
+        if pool is not None:
+            pool.shutdown()
 
-        out_path = os.path.join(out_dir, f"{folder}_face_timeseries.json")
 
-        log.info(f"Procesando: {frames_dir}")
-        data = analyze_frames_dir(
-            frames_dir=frames_dir,
-            enhance=enhance,
-            enforce_detection=enforce_detection
-        )
+def _run_folder(args, log, frames_root: str, folder: str, enhance: bool, enforce_detection: bool, pool) -> None:
+    frames_dir = os.path.join(frames_root, folder)
+    if not os.path.isdir(frames_dir):
+        log.info(f"Saltando (no existe carpeta): {frames_dir}")
+        return
+
+    out_path = os.path.join(args.out_dir, f"{folder}_face_timeseries.json")
+
+    log.info(f"Procesando: {frames_dir}")
+    # el modo adaptativo no escribe journal: refina por rondas, no en orden
+    journal = _journal_for(args, out_path, enhance, enforce_detection) if not args.adaptive > 0 else None
+    data = analyze_frames_dir(
+        frames_dir=frames_dir,
+        enhance=enhance,
+        enforce_detection=enforce_detection,
+        pool=pool,
+        coarse_fps=args.adaptive,
+        min_confidence=args.min_confidence,
+        journal=journal,
+        crops=_crops_for(args, folder, enhance, enforce_detection),
+        **_analysis_opts(args)
+    )
+
+    _save_and_report(log, data, out_path, journal)
+
+
+def _analysis_opts(args) -> Dict[str, Any]:
+    # opciones que van tal cual a face_emotion_day2.analyze_frames
+    return {
+        "server": args.server,
+        "batch_size": args.batch_size,
+        "track": args.track,
+        "keyframe_every": args.keyframe_every,
+        "cache": args.cache,
+        "prefetch": args.prefetch,
+        "prefetch_workers": args.prefetch_workers,
+        "backend": args.backend,
+        "cascade_margin": args.cascade_margin,
+        "cascade_scale": args.cascade_scale,
+    }
+
+
+def _journal_for(args, out_path: str, enhance: bool, enforce_detection: bool) -> Optional[FaceJournal]:
+    if args.no_journal:
+        return None
+    # un journal con otros parámetros no se retoma: se empieza de cero
+    params = {
+        "enhance": enhance,
+        "enforce_detection": enforce_detection,
+        "path": "batched" if (args.server or args.batch_size > 1) else "analyze",  # como el cache
+        # con --server clasifica el modelo del servidor, no --backend
+        "backend": ModelClient(args.server).face_backend() if args.server else backend_fingerprint(args.backend),
+        "track": args.track,
+        "keyframe_every": args.keyframe_every if args.track else None,
+        "target_fps": args.target_fps if args.from_videos else None,
+        "cascade": [args.cascade_margin, args.cascade_scale] if args.cascade_margin > 0 else None,
+    }
+    return FaceJournal(journal_path_for(out_path), params, fsync_every=args.fsync_every)
+
+
+def _crops_for(args, name: str, enhance: bool, enforce_detection: bool) -> Optional[FaceCropWriter]:
+    if not args.save_crops:
+        return None
+    # recortes de otra configuración de detección / CLAHE no se mezclan: se reescriben
+    settings = {
+        "detector": "opencv",
+        "align": True,
+        "enhance": enhance,
+        "enforce_detection": enforce_detection,
+        "track": args.track,
+        "cascade": [args.cascade_margin, args.cascade_scale] if args.cascade_margin > 0 else None,
+        "target_fps": args.target_fps if args.from_videos else None,
+    }
+    return FaceCropWriter(os.path.join(args.save_crops, name), settings)
 
-        write_json(data, out_path)
 
+def _save_and_report(log, data, out_path: str, journal: Optional[FaceJournal] = None) -> None:
+    if journal is not None:
+        # JSON final compactado desde el journal (los items no pasaron por memoria)
+        resumed = data.pop("resumed", 0)  # solo para el log: no va al JSON
+        if resumed:
+            log.info(f"Retomado desde el journal: {resumed} frames ya analizados")
+        counts = journal.compact(out_path, data)
+        n_items, n_errors = counts["items"], counts["errors"]
+        n_track, n_detect = counts["track"], counts["detect"]
+        n_low, n_full = counts["low"], counts["full"]
+    else:
+        write_json(data, out_path)
         items = data.get("items", [])
+        n_items = len(items)
         n_errors = sum(1 for x in items if isinstance(x, dict) and "error" in x)
-        log.info(f"Guardado: {out_path}")
-        log.info(f"Frames: {data.get('n_frames', 0)} | Registros: {len(items)} | Errores: {n_errors}")
+        n_track = sum(1 for x in items if x.get("roi_source") == "track")
+        n_detect = sum(1 for x in items if x.get("roi_source") == "detect")
+        n_low = sum(1 for x in items if x.get("tier") == "low")
+        n_full = sum(1 for x in items if x.get("tier") == "full")
+
+    log.info(f"Guardado: {out_path}")
+    log.info(f"Frames: {data.get('n_frames', n_items)} | Registros: {n_items} | Errores: {n_errors}")
+    if n_track:
+        log.info(f"Tracking: detectados={n_detect} | seguidos={n_track}")
+    if n_low or n_full:
+        log.info(f"Cascada: tier reducido={n_low} | tier completo={n_full}")
+    adaptive = data.get("adaptive")
+    if adaptive:
+        log.info(f"Adaptativo: analizados={adaptive['analyzed']} | interpolados={adaptive['interpolated']}")
+
+
+def _run_from_videos(args, log, enhance: bool, enforce_detection: bool) -> None:
+    videos = sorted([str(p) for p in Path(args.videos_dir).glob("*.mp4")])
+    if args.video_folder:
+        videos = [v for v in videos if Path(v).stem.lower() == args.video_folder.lower()]
+
+    if not videos:
+        raise SystemExit(f"No se encontraron videos .mp4 en: {args.videos_dir}")
+
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    def out_path_for(vp: str) -> str:
+        return os.path.join(args.out_dir, f"{Path(vp).stem.lower()}_face_timeseries.json")
+
+    journals = {vp: _journal_for(args, out_path_for(vp), enhance, enforce_detection) for vp in videos}
+
+    def run_kwargs(vp: str):
+        name = Path(vp).stem.lower()
+        return dict(
+            video_path=vp,
+            target_fps=args.target_fps,
+            enhance=enhance,
+            enforce_detection=enforce_detection,
+            dump_dir=os.path.join(args.frames_root, name) if args.dump_frames else None,
+            journal=journals[vp],
+            crops=_crops_for(args, name, enhance, enforce_detection),
+            **_analysis_opts(args)
+        )
+
+    if args.workers > 1 and not args.server:
+        # un video entero por tarea (decodificar en el worker evita mandar frames entre procesos)
+        with make_face_pool(args.workers, args.tf_threads, args.backend) as pool:
+            futures = {pool.submit(analyze_video_task, **run_kwargs(vp)): vp for vp in sort_longest_first(videos)}
+            for fut in as_completed(futures):
+                vp = futures[fut]
+                data, (hits, misses) = fut.result()
+                if args.cache is not None:
+                    # cada worker tiene su copia del cache: los contadores se suman acá
+                    args.cache.hits += hits
+                    args.cache.misses += misses
+                log.info(f"Terminado (streaming): {vp}")
+                _save_and_report(log, data, out_path_for(vp), journals[vp])
+        return
+
+    for vp in videos:
+        log.info(f"Procesando (streaming): {vp}")
+        data = analyze_video(**run_kwargs(vp))
+
+        _save_and_report(log, data, out_path_for(vp), journals[vp])
 
 
 if __name__ == "__main__":
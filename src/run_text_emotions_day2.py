@@ -1,9 +1,33 @@
 import os
 import argparse
 
-from video_utils import list_subdirs, read_json, write_json
+from video_utils import list_subdirs, write_json
 from logger_utils import get_logger
-from text_emotion_day2 import analyze_text_emotions
+from text_emotion_day2 import analyze_text_emotions, build_text_classifier
+from model_server import DEFAULT_URL, ModelClient, RemoteTextClassifier
+from transcript_stream import find_transcript, follow_transcript, read_transcript
+
+
+def _follow_one(log, in_path: str, out_path: str, model_name: str, classifier):
+    """
+    Sigue un *_transcript.jsonl mientras Whisper escribe: analiza cada tanda de segmentos
+    nuevos apenas aparece y reescribe la salida parcial.
+    """
+    data = {"items": [], "n_segments": 0}
+    for header, new_segments in follow_transcript(in_path):
+        if not new_segments:
+            continue
+        part = analyze_text_emotions(
+            transcript_json={**header, "segments": new_segments},
+            model_name=model_name,
+            classifier=classifier
+        )
+        data["items"].extend(part.get("items", []))
+        data["n_segments"] += part.get("n_segments", 0)
+        write_json(data, out_path)
+        log.info(f"  +{len(new_segments)} segmentos (total {data['n_segments']})")
+    write_json(data, out_path)
+    return data
 
 
 def main():
@@ -25,6 +49,18 @@ def main():
         default="j-hartmann/emotion-english-distilroberta-base",
         help="Modelo HF para emotion (puedes cambiarlo)"
     )
+    ap.add_argument(
+        "--follow",
+        action="store_true",
+        help="Para transcripciones en curso (*_transcript.jsonl), procesa los segmentos a medida que llegan"
+    )
+    ap.add_argument(
+        "--server",
+        nargs="?",
+        const=DEFAULT_URL,
+        default=None,
+        help=f"Clasifica con el servidor de modelos (python src/model_server.py) en vez de cargar el modelo (default {DEFAULT_URL})"
+    )
     args = ap.parse_args()
 
     transcripts_dir = args.transcripts_dir
@@ -36,21 +72,37 @@ def main():
 
     os.makedirs(out_dir, exist_ok=True)
 
-    files = sorted([f for f in os.listdir(transcripts_dir) if f.endswith("_transcript.json")])
-    if not files:
-        raise SystemExit(f"No se encontraron *_transcript.json en: {transcripts_dir}")
+    bases = sorted({
+        f.rsplit("_transcript.", 1)[0]
+        for f in os.listdir(transcripts_dir)
+        if f.endswith("_transcript.json") or f.endswith("_transcript.jsonl")
+    })
+    if not bases:
+        raise SystemExit(f"No se encontraron *_transcript.json(l) en: {transcripts_dir}")
 
-    for fname in files:
-        base = fname.replace("_transcript.json", "")
-        in_path = os.path.join(transcripts_dir, fname)
+    # el modelo se carga una vez para todos los archivos (o queda en el servidor)
+    if args.server:
+        classifier = RemoteTextClassifier(ModelClient(args.server), model_name)
+    else:
+        classifier = build_text_classifier(model_name)
+
+    for base in bases:
+        in_path = find_transcript(transcripts_dir, base)
         out_path = os.path.join(out_dir, f"{base}_text_emotions.json")
 
+        if args.follow and in_path.endswith(".jsonl"):
+            log.info(f"Siguiendo: {in_path}")
+            data = _follow_one(log, in_path, out_path, model_name, classifier)
+            log.info(f"Guardado: {out_path} | Segmentos: {data['n_segments']}")
+            continue
+
         log.info(f"Procesando: {in_path}")
-        transcript = read_json(in_path)
+        transcript = read_transcript(in_path)
 
         data = analyze_text_emotions(
             transcript_json=transcript,
-            model_name=model_name
+            model_name=model_name,
+            classifier=classifier
         )
 
         write_json(data, out_path)
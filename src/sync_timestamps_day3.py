@@ -3,6 +3,7 @@ from typing import Dict, Any, List, Optional
 
 from video_utils import read_json, write_json, normalize_ts
 from logger_utils import get_logger
+from transcript_stream import find_transcript, follow_transcript, read_transcript
 
 log = get_logger("sync_day3")
 
@@ -21,6 +22,30 @@ def _find_segment(segments: List[Dict[str, Any]], t: float) -> Optional[Dict[str
     return None
 
 
+def expand_covered_items(face_items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Frames deduplicados en la extracción traen "covers" (los t que representan).
+    Los expande a un item por t, copiando la emoción del frame representante.
+    """
+    out: List[Dict[str, Any]] = []
+    for f in face_items:
+        covers = f.get("covers")
+        if not covers:
+            out.append(f)
+            continue
+        own_t = normalize_ts(f.get("t"))
+        for ct in covers:
+            ct = normalize_ts(ct)
+            if ct is None:
+                continue
+            g = {k: v for k, v in f.items() if k != "covers"}
+            g["t"] = ct
+            if own_t is None or ct != own_t:
+                g["stand_in_t"] = own_t
+            out.append(g)
+    return out
+
+
 def sync_face_with_text_segments(
     face_timeseries: Dict[str, Any],
     transcript: Dict[str, Any],
@@ -34,7 +59,7 @@ def sync_face_with_text_segments(
     Devuelve un dict con items sincronizados (uno por frame válido).
     """
 
-    face_items = face_timeseries.get("items", [])
+    face_items = expand_covered_items(face_timeseries.get("items", []))
     segments = transcript.get("segments", [])
 
     text_items = None
@@ -118,21 +143,35 @@ def main():
     ap.add_argument("--tr", default="outputs/transcripts", help="carpeta transcripts")
     ap.add_argument("--txt", default="outputs/text_emotions", help="carpeta text_emotions")
     ap.add_argument("--out", default="outputs/sync_preview", help="salida preview")
+    ap.add_argument("--follow", action="store_true",
+                    help="Si el transcript es un .jsonl en curso, re-sincroniza a medida que llegan segmentos")
     args = ap.parse_args()
 
     name = args.name
 
     face_path = os.path.join(args.face, f"{name}_face_timeseries.json")
-    tr_path = os.path.join(args.tr, f"{name}_transcript.json")
+    tr_path = find_transcript(args.tr, name)
     txt_path = os.path.join(args.txt, f"{name}_text_emotions.json")
 
     if not os.path.exists(face_path):
         raise SystemExit(f"Falta: {face_path}")
-    if not os.path.exists(tr_path):
-        raise SystemExit(f"Falta: {tr_path}")
+    if tr_path is None:
+        raise SystemExit(f"Falta: {os.path.join(args.tr, f'{name}_transcript.json')} (o .jsonl)")
 
     face = read_json(face_path)
-    tr = read_json(tr_path)
+    os.makedirs(args.out, exist_ok=True)
+    out_path = os.path.join(args.out, f"{name}_sync_preview.json")
+
+    if args.follow and tr_path.endswith(".jsonl"):
+        # frames cuyo t todavía no tiene segmento quedan con text=None hasta la próxima tanda
+        tr = {"segments": []}
+        for header, new_segments in follow_transcript(tr_path):
+            tr = {**header, "segments": tr["segments"] + new_segments}
+            data = sync_face_with_text_segments(face, tr, None)
+            write_json(data, out_path)
+            log.info(f"+{len(new_segments)} segmentos | n_synced={data['n_synced']}")
+
+    tr = read_transcript(tr_path)
 
     text_emotions = None
     if os.path.exists(txt_path):
@@ -142,8 +181,6 @@ def main():
 
     data = sync_face_with_text_segments(face, tr, text_emotions)
 
-    os.makedirs(args.out, exist_ok=True)
-    out_path = os.path.join(args.out, f"{name}_sync_preview.json")
     write_json(data, out_path)
 
     log.info(f"✅ Preview guardado: {out_path}")
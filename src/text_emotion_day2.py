@@ -1,4 +1,3 @@
-from transformers import pipeline
 from typing import Dict, Any
 from video_utils import read_json, write_json
 import argparse
@@ -11,6 +10,8 @@ emotion_pipe = None
 def get_emotion_pipe(model_name: str = "j-hartmann/emotion-english-distilroberta-base"):
     global emotion_pipe
     if emotion_pipe is None:
+        from transformers import pipeline  # import pesado: solo al cargar el modelo
+
         emotion_pipe = pipeline(
             "text-classification",
             model=model_name,
@@ -107,16 +108,14 @@ def main():
 if __name__ == "__main__":
     main()
 from typing import Dict, Any, List
-from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
 
-def analyze_text_emotions(
-    transcript_json: Dict[str, Any],
-    model_name: str = "pysentimiento/robertuito-emotion-analysis"
-) -> Dict[str, Any]:
+def build_text_classifier(model_name: str = "pysentimiento/robertuito-emotion-analysis"):
+    from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
+
     tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=False)
     model = AutoModelForSequenceClassification.from_pretrained(model_name)
 
-    classifier = pipeline(
+    return pipeline(
         task="text-classification",
         model=model,
         tokenizer=tokenizer,
@@ -124,6 +123,16 @@ def analyze_text_emotions(
         truncation=True
     )
 
+
+def analyze_text_emotions(
+    transcript_json: Dict[str, Any],
+    model_name: str = "pysentimiento/robertuito-emotion-analysis",
+    classifier=None
+) -> Dict[str, Any]:
+    # classifier: opcional, ya cargado (ej: RemoteTextClassifier del servidor de modelos)
+    if classifier is None:
+        classifier = build_text_classifier(model_name)
+
     segments = transcript_json.get("segments", [])
     results: List[Dict[str, Any]] = []
 
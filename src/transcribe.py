@@ -1,39 +1,404 @@
 import os
 import json
+import time
+import wave
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from faster_whisper import WhisperModel
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
+import numpy as np
 
-def transcribe_one(model: WhisperModel, audio_path: str, out_json: str, language: str = "es") -> str:
+from extract_audio import SAMPLE_RATE, iter_pcm_chunks, tee_wav
+from transcript_cache import DEFAULT_CACHE_DIR, TranscriptCache
+from transcript_stream import JsonlTranscriptWriter, jsonl_path_for
+from video_utils import default_cpu_threads, write_json
+from model_server import DEFAULT_URL, ModelClient
+
+if TYPE_CHECKING:
+    from faster_whisper import WhisperModel
+
+
+# ventanas para transcribir audio que llega por chunks (streaming)
+STREAM_WINDOW_S = 30.0
+STREAM_CUT_SEARCH_S = 2.0
+
+
+def _quiet_cut(samples: np.ndarray, sr: int, search_s: float) -> int:
+    """
+    Índice donde cortar la ventana: el tramo de 100 ms con menos energía
+    dentro de los últimos search_s segundos (para no partir palabras).
+    """
+    n = len(samples)
+    hop = max(1, sr // 10)
+    lo = max(0, n - int(search_s * sr))
+    best, best_e = n, None
+    for k in range(lo, n - hop + 1, hop):
+        e = float(np.abs(samples[k:k + hop].astype(np.float32)).mean())
+        if best_e is None or e < best_e:
+            best, best_e = k + hop // 2, e
+    return best
+
+
+def _iter_windows(chunks: Iterable[np.ndarray], sr: int = SAMPLE_RATE,
+                  window_s: float = STREAM_WINDOW_S) -> Iterator[Tuple[float, np.ndarray]]:
+    """
+    Agrupa chunks int16 en ventanas de ~window_s cortadas en silencio.
+    Entrega (offset_segundos, audio_float32); memoria acotada a una ventana.
+    """
+    buf = np.zeros((0,), dtype=np.int16)
+    offset = 0
+    win = int(window_s * sr)
+    for c in chunks:
+        buf = np.concatenate([buf, c])
+        while len(buf) >= win:
+            cut = _quiet_cut(buf[:win], sr, STREAM_CUT_SEARCH_S)
+            yield offset / sr, buf[:cut].astype(np.float32) / 32768.0
+            buf = buf[cut:]
+            offset += cut
+    if len(buf):
+        yield offset / sr, buf.astype(np.float32) / 32768.0
+
+
+def _iter_stream_segments(model: "WhisperModel", chunks: Iterable[np.ndarray], language: str,
+                          state: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    # state["info"] queda con el TranscriptionInfo de la última ventana
+    for offset, audio in _iter_windows(chunks):
+        segs, state["info"] = model.transcribe(audio, language=language, vad_filter=True)
+        for s in segs:
+            yield {
+                "start": float(s.start) + offset,
+                "end": float(s.end) + offset,
+                "text": s.text.strip()
+            }
+
+
+def transcribe_one(
+    model: "WhisperModel",
+    audio: Union[str, Iterable[np.ndarray]],
+    out_json: str,
+    language: str = "es",
+    source: str = None,
+    batch_size: int = 0,
+    cache: Optional[TranscriptCache] = None,
+    jsonl: bool = False,
+) -> str:
+    """
+    audio: ruta a WAV, o un iterable de chunks int16 mono 16 kHz (ej: extract_audio.iter_pcm_chunks).
+    Con chunks se transcribe por ventanas a medida que llegan, sin esperar a que termine la extracción.
+    batch_size > 0 (solo con ruta): inferencia por lotes de faster-whisper sobre los tramos de voz
+    de un archivo largo (BatchedInferencePipeline).
+    cache (solo con ruta): si las muestras y los parámetros coinciden, escribe el JSON
+    guardado sin correr Whisper.
+    jsonl: además escribe <name>_transcript.jsonl segmento a segmento (con flush) para que
+    las etapas siguientes puedan ir leyendo mientras Whisper corre (ver transcript_stream.py).
+    """
     os.makedirs(os.path.dirname(out_json), exist_ok=True)
 
-    segments, info = model.transcribe(
-        audio_path,
-        language=language,
-        vad_filter=True
-    )
+    key = None
+    if cache is not None and isinstance(audio, str):
+        key = cache.key(audio, language=language, vad_filter=True, batch_size=batch_size)
+        hit = cache.get(key)
+        if hit is not None:
+            hit = {**hit, "audio": source or audio}
+            if jsonl:
+                _write_jsonl(out_json, hit)
+            with open(out_json, "w", encoding="utf-8") as f:
+                json.dump(hit, f, indent=2, ensure_ascii=False)
+            return out_json
+
+    state: Dict[str, Any] = {"info": None}
+    if isinstance(audio, str):
+        if batch_size > 0:
+            from faster_whisper import BatchedInferencePipeline  # faster-whisper >= 1.0
+
+            segs, state["info"] = BatchedInferencePipeline(model=model).transcribe(
+                audio,
+                language=language,
+                vad_filter=True,
+                batch_size=batch_size
+            )
+        else:
+            segs, state["info"] = model.transcribe(
+                audio,
+                language=language,
+                vad_filter=True
+            )
+        seg_iter = ({"start": float(s.start), "end": float(s.end), "text": s.text.strip()} for s in segs)
+        source = source or audio
+    else:
+        seg_iter = _iter_stream_segments(model, audio, language, state)
 
+    writer = None
+    if jsonl:
+        info = state["info"]
+        writer = JsonlTranscriptWriter(jsonl_path_for(out_json), {
+            "audio": source,
+            "language": info.language if info is not None else language
+        })
+
+    # los segmentos de faster-whisper son perezosos: cada uno sale al jsonl apenas se decodifica
+    segments: List[Dict[str, Any]] = []
+    for seg in seg_iter:
+        segments.append(seg)
+        if writer is not None:
+            writer.segment(seg)
+
+    info = state["info"]
     data = {
-        "audio": audio_path,
-        "language": info.language,
-        "language_probability": float(info.language_probability),
-        "segments": []
+        "audio": source,
+        "language": info.language if info is not None else language,
+        "language_probability": float(info.language_probability) if info is not None else 0.0,
+        "segments": segments
     }
 
-    for s in segments:
-        data["segments"].append({
-            "start": float(s.start),
-            "end": float(s.end),
-            "text": s.text.strip()
+    # summary del .jsonl antes del .json: terminado, el .json queda como el más nuevo (find_transcript)
+    if writer is not None:
+        writer.close({
+            "language": data["language"],
+            "language_probability": data["language_probability"],
+            "out_json": out_json
         })
 
     with open(out_json, "w", encoding="utf-8") as f:
         json.dump(data, f, indent=2, ensure_ascii=False)
 
+    if key is not None:
+        cache.put(key, data)
+
     return out_json
 
 
+def _write_jsonl(out_json: str, data: Dict[str, Any]) -> None:
+    writer = JsonlTranscriptWriter(jsonl_path_for(out_json), {"audio": data.get("audio"), "language": data.get("language")})
+    for seg in data.get("segments", []):
+        writer.segment(seg)
+    writer.close({
+        "language": data.get("language"),
+        "language_probability": data.get("language_probability"),
+        "out_json": out_json
+    })
+
+
+# modelo y cache por proceso (se cargan una vez en el initializer del pool)
+_worker_model = None
+_worker_cache = None
+
+
+def _cache_settings(model_name: str, device: str, compute_type: str) -> Dict[str, Any]:
+    return {"model": model_name, "device": device, "compute_type": compute_type}
+
+
+class _LazyModel:
+    """
+    Proxy que construye el WhisperModel recién cuando se llama a transcribe().
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._model = None
+
+    def transcribe(self, *args, **kwargs):
+        if self._model is None:
+            self._model = self._factory()
+        return self._model.transcribe(*args, **kwargs)
+
+    def __getattr__(self, name):
+        if self._model is None:
+            self._model = self._factory()
+        return getattr(self._model, name)
+
+
+def load_whisper(model_name: str, **kwargs) -> "WhisperModel":
+    from faster_whisper import WhisperModel  # import pesado: con --server no se paga
+
+    return WhisperModel(model_name, **kwargs)
+
+
+def _init_worker(model_name: str, device: str, compute_type: str, cpu_threads: int,
+                 cache_dir: Optional[str] = None) -> None:
+    global _worker_model, _worker_cache
+    if cache_dir:
+        _worker_cache = TranscriptCache(cache_dir, settings=_cache_settings(model_name, device, compute_type))
+    # el modelo se carga recién al primer miss: si todo está en cache no se paga la carga
+    _worker_model = _LazyModel(
+        lambda: load_whisper(model_name, device=device, compute_type=compute_type, cpu_threads=cpu_threads)
+    )
+
+
+def _wav_duration(path: str) -> float:
+    with wave.open(path, "rb") as w:
+        return w.getnframes() / float(w.getframerate() or 1)
+
+
+def _transcribe_file(apath: str, out_json: str, language: str, batch_size: int, jsonl: bool = False) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    hits = _worker_cache.hits if _worker_cache is not None else 0
+    transcribe_one(_worker_model, apath, out_json, language=language, batch_size=batch_size,
+                   cache=_worker_cache, jsonl=jsonl)
+    cached = _worker_cache is not None and _worker_cache.hits > hits
+    elapsed = time.perf_counter() - t0
+    duration = _wav_duration(apath)
+    return {
+        "audio": apath,
+        "out_json": out_json,
+        "duration": duration,
+        "elapsed": elapsed,
+        "rtf": elapsed / duration if duration > 0 else 0.0,
+        "cached": cached
+    }
+
+
+def _read_wav_span(path: str, start_s: float, end_s: float) -> np.ndarray:
+    """
+    Lee [start_s, end_s) de un WAV pcm_s16le como float32 mono (promedia canales).
+    """
+    with wave.open(path, "rb") as w:
+        sr = w.getframerate()
+        nch = w.getnchannels()
+        a = max(0, int(start_s * sr))
+        b = min(w.getnframes(), int(end_s * sr))
+        w.setpos(a)
+        buf = w.readframes(max(0, b - a))
+    x = np.frombuffer(buf, dtype="<i2").astype(np.float32) / 32768.0
+    if nch > 1:
+        x = x.reshape(-1, nch).mean(axis=1)
+    return x
+
+
+def find_silence_cuts(path: str, chunk_s: float, block_s: float = 600.0) -> List[float]:
+    """
+    Puntos de corte (segundos) cada ~chunk_s, ubicados en el centro del silencio
+    (hueco entre tramos de voz según el VAD de faster-whisper) más cercano al objetivo.
+    El VAD corre por bloques de block_s para no cargar horas de audio en memoria.
+    """
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+    duration = _wav_duration(path)
+    opts = VadOptions(min_silence_duration_ms=500)
+    gaps: List[float] = []
+    t = 0.0
+    while t < duration:
+        block = _read_wav_span(path, t, min(duration, t + block_s))
+        speech = get_speech_timestamps(block, opts)
+        for prev, nxt in zip(speech, speech[1:]):
+            gaps.append(t + (prev["end"] + nxt["start"]) / 2.0 / SAMPLE_RATE)
+        t += block_s
+
+    cuts: List[float] = []
+    target = chunk_s
+    while target < duration - chunk_s / 2.0:
+        near = [g for g in gaps if abs(g - target) <= chunk_s / 2.0 and (not cuts or g > cuts[-1])]
+        cut = min(near, key=lambda g: abs(g - target)) if near else target
+        cuts.append(cut)
+        target = cut + chunk_s
+    return cuts
+
+
+def _transcribe_span(apath: str, start_s: float, end_s: float, keep_from: float, keep_to: float,
+                     language: str) -> Dict[str, Any]:
+    """
+    Worker: transcribe [start_s, end_s) (incluye solapamiento) y se queda con los
+    segmentos cuyo centro cae en [keep_from, keep_to), con tiempos globales.
+    """
+    audio = _read_wav_span(apath, start_s, end_s)
+    segs, info = _worker_model.transcribe(audio, language=language, vad_filter=True)
+    out = []
+    for s in segs:
+        st, en = float(s.start) + start_s, float(s.end) + start_s
+        mid = (st + en) / 2.0
+        if keep_from <= mid < keep_to:
+            out.append({"start": st, "end": en, "text": s.text.strip()})
+    return {
+        "language": info.language,
+        "language_probability": float(info.language_probability),
+        "segments": out
+    }
+
+
+def _stitch(parts: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    # une en orden; del chunk siguiente se descartan los segmentos que empiezan antes del
+    # último end del anterior (ventana de solape: whisper rara vez repite el texto exacto)
+    out: List[Dict[str, Any]] = []
+    for segs in parts:
+        prev_end = out[-1]["end"] if out else None
+        for s in segs:
+            if prev_end is not None and s["start"] < prev_end:
+                continue
+            out.append(s)
+    return out
+
+
+def transcribe_long(
+    ex: ProcessPoolExecutor,
+    apath: str,
+    out_json: str,
+    language: str = "es",
+    chunk_s: float = 300.0,
+    overlap_s: float = 1.0,
+    cache: Optional[TranscriptCache] = None,
+    jsonl: bool = False,
+) -> Dict[str, Any]:
+    """
+    Corta un WAV largo en silencios (VAD), transcribe los chunks en paralelo en el pool `ex`
+    (workers iniciados con _init_worker) y los une con start/end globales.
+    jsonl: como en transcribe_one; los segmentos salen chunk a chunk, en orden, a medida
+    que terminan.
+    """
+    t0 = time.perf_counter()
+    duration = _wav_duration(apath)
+    result = {"audio": apath, "out_json": out_json, "duration": duration, "cached": False, "chunks": 0}
+
+    key = None
+    if cache is not None:
+        key = cache.key(apath, language=language, vad_filter=True, split_chunk_s=chunk_s)
+        hit = cache.get(key)
+        if hit is not None:
+            if jsonl:
+                _write_jsonl(out_json, {**hit, "audio": apath})
+            write_json({**hit, "audio": apath}, out_json)
+            elapsed = time.perf_counter() - t0
+            return {**result, "elapsed": elapsed, "rtf": elapsed / duration if duration > 0 else 0.0, "cached": True}
+
+    bounds = [0.0] + find_silence_cuts(apath, chunk_s) + [duration]
+    futures = [
+        ex.submit(_transcribe_span, apath, max(0.0, a - overlap_s), min(duration, b + overlap_s),
+                  a, b if k < len(bounds) - 2 else float("inf"), language)
+        for k, (a, b) in enumerate(zip(bounds, bounds[1:]))
+    ]
+    writer = JsonlTranscriptWriter(jsonl_path_for(out_json), {"audio": apath, "language": language}) \
+        if jsonl else None
+    parts = []
+    written = 0
+    for f in futures:
+        parts.append(f.result())
+        if writer is not None:
+            # _stitch solo descarta del chunk nuevo: lo ya escrito no cambia
+            stitched = _stitch([p["segments"] for p in parts])
+            for seg in stitched[written:]:
+                writer.segment(seg)
+            written = len(stitched)
+
+    data = {
+        "audio": apath,
+        "language": parts[0]["language"] if parts else language,
+        "language_probability": parts[0]["language_probability"] if parts else 0.0,
+        "segments": _stitch([p["segments"] for p in parts])
+    }
+    if writer is not None:
+        writer.close({
+            "language": data["language"],
+            "language_probability": data["language_probability"],
+            "out_json": out_json
+        })
+    write_json(data, out_json)
+    if key is not None:
+        cache.put(key, data)
+
+    elapsed = time.perf_counter() - t0
+    return {**result, "elapsed": elapsed, "rtf": elapsed / duration if duration > 0 else 0.0, "chunks": len(parts)}
+
+
 def main():
     ap = argparse.ArgumentParser(description="Transcribir WAV usando faster-whisper")
     ap.add_argument("--audio-dir", default="outputs/audio", help="Carpeta con audios .wav")
@@ -42,22 +407,125 @@ def main():
     ap.add_argument("--device", default="cpu", help="cpu o cuda")
     ap.add_argument("--compute-type", default="int8", help="int8 / float16 / float32")
     ap.add_argument("--language", default="es", help="Idioma (es)")
+    ap.add_argument("--from-videos", action="store_true",
+                    help="Transcribe directo desde los .mp4 (audio por pipe), sin WAV intermedio")
+    ap.add_argument("--videos-dir", default="data/raw_videos", help="Carpeta con videos .mp4 (modo --from-videos)")
+    ap.add_argument("--save-wav-dir", default=None,
+                    help="Con --from-videos, guarda además el WAV mientras transcribe (ej: outputs/audio)")
+    ap.add_argument("--workers", type=int, default=1, help="Procesos en paralelo, cada uno con su modelo")
+    ap.add_argument("--cpu-threads", type=int, default=0,
+                    help="Hilos de CTranslate2 por proceso (0 = núcleos / workers)")
+    ap.add_argument("--batch-size", type=int, default=0,
+                    help="Inferencia por lotes dentro de cada archivo (BatchedInferencePipeline, ej 8). 0 = desactivado")
+    ap.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Cache de transcripciones (por hash de audio + parámetros)")
+    ap.add_argument("--no-cache", action="store_true", help="No leer ni escribir el cache")
+    ap.add_argument("--cache-max-mb", type=float, default=500.0, help="Tamaño máximo del cache (MB)")
+    ap.add_argument("--cache-max-days", type=float, default=30.0, help="Antigüedad máxima de una entrada sin usar (días)")
+    ap.add_argument("--split-long", type=float, default=0.0,
+                    help="Con --workers > 1: archivos de más de N segundos se cortan en silencios y sus chunks "
+                         "se transcriben en paralelo (0 = desactivado)")
+    ap.add_argument("--chunk-s", type=float, default=300.0, help="Largo objetivo de cada chunk para --split-long")
+    ap.add_argument("--jsonl", action="store_true",
+                    help="Escribe también *_transcript.jsonl segmento a segmento (para seguirlo con --follow)")
+    ap.add_argument("--server", nargs="?", const=DEFAULT_URL, default=None,
+                    help=f"Transcribe con el servidor de modelos ya cargado (python src/model_server.py, default {DEFAULT_URL}); "
+                         "el modelo y el cache son los del servidor")
     args = ap.parse_args()
 
     audio_dir = args.audio_dir
     out_dir = args.out_dir
 
+    if args.from_videos and args.server:
+        raise SystemExit("--server trabaja sobre .wav: extrae el audio primero (o usa --from-videos sin --server)")
+
+    if args.from_videos:
+        videos = sorted([str(p) for p in Path(args.videos_dir).glob("*.mp4")])
+        if not videos:
+            raise SystemExit(f"No se encontraron videos .mp4 en: {args.videos_dir}")
+
+        model = load_whisper(args.model, device=args.device, compute_type=args.compute_type)
+        for vp in videos:
+            name = Path(vp).stem.lower()
+            out_json = os.path.join(out_dir, f"{name}_transcript.json")
+            chunks = iter_pcm_chunks(vp)
+            if args.save_wav_dir:
+                chunks = tee_wav(chunks, os.path.join(args.save_wav_dir, f"{name}.wav"))
+            transcribe_one(model, chunks, out_json, language=args.language, source=vp, jsonl=args.jsonl)
+            print(f"✅ Transcript: {name} -> {out_json}")
+        return
+
     audios = sorted([str(p) for p in Path(audio_dir).glob("*.wav")])
     if not audios:
         raise SystemExit(f"No se encontraron .wav en: {audio_dir}")
 
-    model = WhisperModel(args.model, device=args.device, compute_type=args.compute_type)
+    def out_json_for(apath: str) -> str:
+        return os.path.join(out_dir, f"{Path(apath).stem.lower()}_transcript.json")
+
+    def report(r: Dict[str, Any]) -> None:
+        name = Path(r["audio"]).stem.lower()
+        print(f"✅ Transcript: {name} -> {r['out_json']} | audio={r['duration']:.1f}s | "
+              f"t={r['elapsed']:.1f}s | RTF={r['rtf']:.3f}{' | cache' if r['cached'] else ''}"
+              f"{' | chunks=' + str(r['chunks']) if r.get('chunks') else ''}")
+
+    cpu_threads = args.cpu_threads or default_cpu_threads(args.workers)
+    cache_dir = None if args.no_cache else args.cache_dir
+    init = (args.model, args.device, args.compute_type, cpu_threads, cache_dir)
+    t_wall = time.perf_counter()
+    results: List[Dict[str, Any]] = []
+
+    if args.server:
+        cache_dir = None  # el cache lo maneja el servidor
+        client = ModelClient(args.server)
+        for apath in audios:
+            results.append(client.transcribe(apath, out_json_for(apath), language=args.language,
+                                             batch_size=args.batch_size, jsonl=args.jsonl))
+            report(results[-1])
+    elif args.workers <= 1:
+        _init_worker(*init)
+        for apath in audios:
+            results.append(_transcribe_file(apath, out_json_for(apath), args.language, args.batch_size, args.jsonl))
+            report(results[-1])
+    else:
+        # los más largos primero para que no queden de cola
+        audios = sorted(audios, key=_wav_duration, reverse=True)
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=init) as ex:
+            if args.split_long > 0:
+                # largos: uno a la vez, pero con todos los workers sobre sus chunks
+                long_audios = [a for a in audios if _wav_duration(a) > args.split_long]
+                audios = [a for a in audios if a not in long_audios]
+                cache = None
+                if cache_dir:
+                    cache = TranscriptCache(cache_dir, settings=_cache_settings(args.model, args.device, args.compute_type))
+                for apath in long_audios:
+                    results.append(transcribe_long(ex, apath, out_json_for(apath), language=args.language,
+                                                   chunk_s=args.chunk_s, cache=cache, jsonl=args.jsonl))
+                    report(results[-1])
+
+            futures = [
+                ex.submit(_transcribe_file, apath, out_json_for(apath), args.language, args.batch_size, args.jsonl)
+                for apath in audios
+            ]
+            for fut in as_completed(futures):
+                results.append(fut.result())
+                report(results[-1])
+
+    wall = time.perf_counter() - t_wall
+    total_audio = sum(r["duration"] for r in results)
+    print(f"📊 Total: {len(results)} archivos | audio={total_audio:.1f}s | t={wall:.1f}s | "
+          f"RTF global={wall / total_audio if total_audio > 0 else 0.0:.3f} | "
+          f"throughput={total_audio / wall if wall > 0 else 0.0:.1f}x tiempo real "
+          f"(workers={args.workers}, cpu_threads={cpu_threads})")
 
-    for apath in audios:
-        name = Path(apath).stem.lower()
-        out_json = os.path.join(out_dir, f"{name}_transcript.json")
-        transcribe_one(model, apath, out_json, language=args.language)
-        print(f"✅ Transcript: {name} -> {out_json}")
+    if cache_dir:
+        n_hits = sum(1 for r in results if r["cached"])
+        cache = TranscriptCache(
+            cache_dir,
+            max_bytes=int(args.cache_max_mb * 1024 * 1024),
+            max_age_days=args.cache_max_days
+        )
+        ev = cache.evict()
+        print(f"🗃️ Cache: hits={n_hits} | misses={len(results) - n_hits} | "
+              f"evictadas={ev['removed']} | tamaño={ev['bytes'] / 1e6:.1f} MB")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import wave
+import hashlib
+from typing import Any, Dict, Optional
+
+from video_utils import read_json, write_json
+
+
+DEFAULT_CACHE_DIR = ".cache/transcripts"
+
+
+def wav_samples_sha256(path: str, chunk_frames: int = 1 << 16) -> str:
+    """
+    Hash de las MUESTRAS del WAV (no del archivo): re-escribir la cabecera
+    o regenerar el mismo audio no invalida el cache.
+    """
+    h = hashlib.sha256()
+    with wave.open(path, "rb") as w:
+        h.update(f"{w.getnchannels()}:{w.getsampwidth()}:{w.getframerate()}".encode("utf-8"))
+        while True:
+            buf = w.readframes(chunk_frames)
+            if not buf:
+                break
+            h.update(buf)
+    return h.hexdigest()
+
+
+class TranscriptCache:
+    """
+    Cache en disco de transcripciones, direccionado por contenido:
+      clave = sha256(muestras del audio + parámetros de decodificación)
+    settings: parámetros fijos del modelo (nombre, compute_type, device...).
+    Evicción por antigüedad (max_age_days) y tamaño total (max_bytes, se borran
+    primero las entradas usadas hace más tiempo).
+    """
+
+    def __init__(
+        self,
+        root: str = DEFAULT_CACHE_DIR,
+        settings: Optional[Dict[str, Any]] = None,
+        max_bytes: int = 500 * 1024 * 1024,
+        max_age_days: float = 30.0,
+    ):
+        self.root = root
+        self.settings = dict(settings or {})
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, audio_path: str, **params: Any) -> str:
+        p = json.dumps({**self.settings, **params}, sort_keys=True, ensure_ascii=False)
+        h = hashlib.sha256()
+        h.update(wav_samples_sha256(audio_path).encode("utf-8"))
+        h.update(p.encode("utf-8"))
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        try:
+            data = read_json(path)
+        except Exception:
+            self.misses += 1
+            return None
+        os.utime(path, None)  # mtime = último uso (para la evicción)
+        self.hits += 1
+        return data
+
+    def put(self, key: str, data: Dict[str, Any]) -> None:
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        write_json(data, tmp, indent=None)
+        os.replace(tmp, path)  # atómico: otro proceso nunca lee un JSON a medias
+
+    def evict(self) -> Dict[str, int]:
+        now = time.time()
+        max_age = self.max_age_days * 86400.0
+        entries = []
+        removed = 0
+        for dirpath, _dirs, files in os.walk(self.root):
+            for f in files:
+                if not f.endswith(".json"):
+                    continue
+                path = os.path.join(dirpath, f)
+                st = os.stat(path)
+                if self.max_age_days > 0 and now - st.st_mtime > max_age:
+                    os.remove(path)
+                    removed += 1
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        if self.max_bytes > 0:
+            for _mtime, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                os.remove(path)
+                total -= size
+                removed += 1
+
+        return {"removed": removed, "bytes": total}
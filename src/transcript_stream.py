@@ -0,0 +1,172 @@
+import os
+import json
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from video_utils import read_json
+
+
+# tipos de registro en *_transcript.jsonl
+HEADER = "header"
+SEGMENT = "segment"
+SUMMARY = "summary"
+
+
+def jsonl_path_for(out_json: str) -> str:
+    base, _ext = os.path.splitext(out_json)
+    return f"{base}.jsonl"
+
+
+class JsonlTranscriptWriter:
+    """
+    Escribe la transcripción como JSON Lines a medida que salen los segmentos:
+      {"type": "header", "audio", "language", ...}
+      {"type": "segment", "start", "end", "text"}   (uno por línea, con flush)
+      {"type": "summary", "n_segments", "language", "language_probability", ...}
+    El summary marca que la transcripción terminó.
+    """
+
+    def __init__(self, path: str, header: Dict[str, Any]):
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self.path = path
+        self.n = 0
+        self._f = open(path, "w", encoding="utf-8")
+        self._write({"type": HEADER, **header})
+
+    def _write(self, rec: Dict[str, Any]) -> None:
+        self._f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        self._f.flush()
+
+    def segment(self, seg: Dict[str, Any]) -> None:
+        self._write({"type": SEGMENT, **seg})
+        self.n += 1
+
+    def close(self, summary: Optional[Dict[str, Any]] = None) -> None:
+        self._write({"type": SUMMARY, "n_segments": self.n, **(summary or {})})
+        self._f.close()
+
+
+def _records_to_transcript(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    data: Dict[str, Any] = {"audio": None, "language": None, "language_probability": None, "segments": []}
+    for r in records:
+        kind = r.get("type")
+        body = {k: v for k, v in r.items() if k != "type"}
+        if kind == HEADER:
+            data.update({k: v for k, v in body.items() if k in ("audio", "language", "language_probability")})
+        elif kind == SEGMENT:
+            data["segments"].append(body)
+        elif kind == SUMMARY:
+            data.update({k: v for k, v in body.items() if k in ("language", "language_probability")})
+            data["complete"] = True
+    data.setdefault("complete", False)
+    return data
+
+
+def read_transcript(path: str) -> Dict[str, Any]:
+    """
+    Lee un transcript .json (formato original) o .jsonl (streaming, aunque esté a medias)
+    y devuelve siempre {audio, language, language_probability, segments}.
+    """
+    if not path.endswith(".jsonl"):
+        return read_json(path)
+
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break  # última línea todavía escribiéndose
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return _records_to_transcript(records)
+
+
+def jsonl_finished(path: str) -> bool:
+    """
+    True si el .jsonl ya tiene su summary (el escritor terminó).
+    """
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 65536))
+        lines = f.read().split(b"\n")
+    # la última línea completa es la anterior al "\n" final (si lo hay)
+    complete = [ln for ln in lines[:-1] if ln.strip()]
+    if not complete:
+        return False
+    try:
+        return json.loads(complete[-1].decode("utf-8")).get("type") == SUMMARY
+    except ValueError:
+        return False
+
+
+def find_transcript(tr_dir: str, name: str) -> Optional[str]:
+    """
+    Prefiere el .json final, salvo que el .jsonl sea más nuevo o siga escribiéndose
+    (transcripción re-lanzada: el .json es de la corrida anterior). Sin .json, el .jsonl.
+    """
+    p_json = os.path.join(tr_dir, f"{name}_transcript.json")
+    p_jsonl = os.path.join(tr_dir, f"{name}_transcript.jsonl")
+    has_json, has_jsonl = os.path.exists(p_json), os.path.exists(p_jsonl)
+    if has_json and has_jsonl:
+        if os.path.getmtime(p_jsonl) > os.path.getmtime(p_json) or not jsonl_finished(p_jsonl):
+            return p_jsonl
+        return p_json
+    if has_json:
+        return p_json
+    if has_jsonl:
+        return p_jsonl
+    return None
+
+
+def follow_transcript(
+    path: str,
+    poll_s: float = 0.5,
+    idle_timeout: float = 600.0,
+) -> Iterator[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+    """
+    Hace "tail" de un *_transcript.jsonl: entrega (header, nuevos_segmentos) cada vez que
+    aparecen segmentos, hasta ver el summary o pasar idle_timeout segundos sin novedades.
+    """
+    header: Dict[str, Any] = {}
+    pending = ""
+    last_activity = time.time()
+
+    while not os.path.exists(path):
+        if time.time() - last_activity > idle_timeout:
+            return
+        time.sleep(poll_s)
+
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            chunk = f.read()
+            new_segments: List[Dict[str, Any]] = []
+            done = False
+            if chunk:
+                last_activity = time.time()
+                pending += chunk
+                lines = pending.split("\n")
+                pending = lines.pop()  # fragmento sin "\n": se completa en la próxima lectura
+                for line in lines:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    rec = json.loads(line)
+                    kind = rec.pop("type", None)
+                    if kind == HEADER:
+                        header = rec
+                    elif kind == SEGMENT:
+                        new_segments.append(rec)
+                    elif kind == SUMMARY:
+                        header = {**header, **{k: v for k, v in rec.items() if k in ("language", "language_probability")}}
+                        done = True
+
+            if new_segments or done:
+                yield header, new_segments
+            if done:
+                return
+            if time.time() - last_activity > idle_timeout:
+                return
+            if not chunk:
+                time.sleep(poll_s)
@@ -1,6 +1,8 @@
 import os
 import re
 import json
+import hashlib
+import shutil
 from typing import Any, Dict, List, Optional, Tuple
 
 
@@ -69,6 +71,63 @@ def segment_contains_t(seg: Dict[str, Any], t: float) -> bool:
     return s <= t <= e
 
 
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def ffmpeg_exe() -> str:
+    """
+    Binario de ffmpeg: el que trae imageio-ffmpeg (dependencia de MoviePy) o el del PATH.
+    """
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        exe = shutil.which("ffmpeg")
+        if exe is None:
+            raise RuntimeError("No se encontró ffmpeg (instala imageio-ffmpeg o agrega ffmpeg al PATH)")
+        return exe
+
+
+def probe_duration(video_path: str) -> float:
+    """
+    Duración (segundos) leída de la cabecera del contenedor, sin decodificar.
+    Si no se puede, retorna 0.0.
+    """
+    import cv2  # import local: video_utils no depende de OpenCV para lo demás
+
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            return 0.0
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        n = cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0.0
+        return float(n / fps) if fps > 0 else 0.0
+    finally:
+        cap.release()
+
+
+def sort_longest_first(videos: List[str]) -> List[str]:
+    """
+    Ordena videos por duración descendente (desempata por tamaño en disco),
+    para que en un pool los largos arranquen primero y no queden de cola.
+    """
+    def key(vp: str) -> Tuple[float, int]:
+        size = os.path.getsize(vp) if os.path.exists(vp) else 0
+        return (-probe_duration(vp), -size)
+
+    return sorted(videos, key=key)
+
+
+def default_cpu_threads(workers: int) -> int:
+    # reparte los núcleos entre procesos para no sobre-suscribir la CPU
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
 def safe_basename_no_ext(path: str) -> str:
     base = os.path.basename(path)
     return os.path.splitext(base)[0]